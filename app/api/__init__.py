@@ -1,5 +1,5 @@
 """API module."""
 
-from app.api.routes import router
+from app.api.routes import router, wait_for_pending_writes
 
-__all__ = ["router"]
+__all__ = ["router", "wait_for_pending_writes"]
@@ -1,12 +1,22 @@
 """API routes for the SmartTask FAQ service."""
 
+import asyncio
+import codecs
+import json
 import os
 import re
 import time
-from typing import List
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Query
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
+from starlette.background import BackgroundTask
 
 from app.models import (
     AskRequest,
@@ -17,8 +27,8 @@ from app.models import (
     QueryHistoryItem,
     ErrorResponse,
 )
-from app.db import get_db, QueryHistory, check_db_connection
-from app.services import cache_service, rag_service, llm_service
+from app.db import get_db, AsyncSessionLocal, QueryHistory, check_db_connection
+from app.services import cache_service, rag_service, llm_service, StreamUsage
 from app.utils import (
     get_logger,
     record_cache_hit,
@@ -35,9 +45,44 @@ logger = get_logger(__name__)
 settings = get_settings()
 router = APIRouter()
 
+# Settings are cached for the process lifetime, so hot-path fields are read once
+LLM_PROVIDER = settings.llm_provider
+
 # Security constants
 MAX_FILE_SIZE_BYTES = 5 * 1024 * 1024  # 5 MB
+UPLOAD_READ_CHUNK_BYTES = 64 * 1024  # 64 KB
 ALLOWED_FILENAME_PATTERN = re.compile(r'^[\w\-. ]+$')  # alphanumeric, dash, dot, space
+UNSAFE_FILENAME_CHARS = re.compile(r'[^\w\-.]')
+
+# Byte-level form of the ASCII subset of ALLOWED_FILENAME_PATTERN, used with
+# bytes.translate so the fast path runs as a single C loop
+_ALLOWED_FILENAME_BYTES = bytes(
+    i for i in range(128) if chr(i).isalnum() or chr(i) in '-_. '
+)
+
+# Content type of /ask/stream responses
+STREAM_MEDIA_TYPE = "text/plain; charset=utf-8"
+
+# Per-dependency timeout for /health probes
+HEALTH_CHECK_TIMEOUT = 1.0  # seconds
+
+# History insert executed directly on the asyncpg connection. asyncpg prepares
+# the statement once per pooled connection and reuses it from its statement cache.
+INSERT_HISTORY_SQL = (
+    "INSERT INTO query_history "
+    "(id, question, answer, tokens_used, response_time_ms, sources, created_at) "
+    "VALUES ($1, $2, $3, $4, $5, $6, $7)"
+)
+
+# Validates a whole page of history rows in a single call into pydantic-core
+_HISTORY_ADAPTER = TypeAdapter(List[QueryHistoryItem])
+
+# Dumps the /ask sources list to plain dicts in a single call
+_SOURCES_ADAPTER = TypeAdapter(List[SourceInfo])
+
+# Fire-and-forget history and semantic cache writes still in flight
+# (drained on shutdown)
+_pending_writes: Set[asyncio.Task] = set()
 
 
 def sanitize_filename(filename: str) -> str:
@@ -50,17 +95,259 @@ def sanitize_filename(filename: str) -> str:
     Returns:
         Sanitized filename safe for storage
     """
+    # Fast path: a name made only of allowed ASCII characters has no path
+    # components and needs no substitution
+    if filename and not filename.encode('utf-8', 'replace').translate(
+        None, _ALLOWED_FILENAME_BYTES
+    ):
+        return filename
+
     # Remove any path components
     filename = os.path.basename(filename)
     # Replace potentially dangerous characters
     if not ALLOWED_FILENAME_PATTERN.match(filename):
         # Generate safe filename preserving extension
         name, ext = os.path.splitext(filename)
-        safe_name = re.sub(r'[^\w\-.]', '_', name)
+        safe_name = UNSAFE_FILENAME_CHARS.sub('_', name)
         filename = f"{safe_name}{ext}"
     return filename
 
 
+async def insert_history(
+    db: AsyncSession,
+    question: str,
+    answer: str,
+    tokens_used: int,
+    response_time_ms: int,
+    sources: List[dict],
+) -> uuid.UUID:
+    """
+    Insert a query history row bypassing the ORM unit of work.
+
+    The row is written with a single prepared ``INSERT`` on the raw asyncpg
+    connection, so no identity map, flush or extra round trip is involved.
+    The driver call does not start the session's transaction, so the row is
+    committed by asyncpg on its own and no ``commit()`` is needed.
+
+    Args:
+        db: Request-scoped database session
+        question: User question
+        answer: Generated answer
+        tokens_used: Number of tokens used
+        response_time_ms: Response time in milliseconds
+        sources: Serializable list of source dicts
+
+    Returns:
+        ID of the inserted row
+    """
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    entry_id = uuid.uuid4()
+    await raw_connection.driver_connection.execute(
+        INSERT_HISTORY_SQL,
+        entry_id,
+        question,
+        answer,
+        tokens_used,
+        response_time_ms,
+        orjson.dumps(sources).decode(),
+        datetime.utcnow(),
+    )
+    return entry_id
+
+
+async def _persist_history(
+    question: str,
+    answer: str,
+    tokens_used: int,
+    response_time_ms: int,
+    sources: List[dict],
+) -> None:
+    """Save a query to history using its own session, outside the request."""
+    try:
+        async with AsyncSessionLocal() as session:
+            query_id = await insert_history(
+                session,
+                question=question,
+                answer=answer,
+                tokens_used=tokens_used,
+                response_time_ms=response_time_ms,
+                sources=sources,
+            )
+        logger.info("Saved to history", query_id=str(query_id))
+    except Exception as e:
+        logger.warning("Failed to save to history", error=str(e))
+
+
+def schedule_history_write(
+    question: str,
+    answer: str,
+    tokens_used: int,
+    response_time_ms: int,
+    sources: List[dict],
+) -> asyncio.Task:
+    """
+    Schedule a history write without blocking the response.
+
+    The task is tracked until it finishes so shutdown can wait for it.
+
+    Returns:
+        The scheduled task
+    """
+    return _track_write(
+        _persist_history(question, answer, tokens_used, response_time_ms, sources)
+    )
+
+
+def schedule_semantic_cache_write(
+    question: str,
+    answer: str,
+    sources: List[dict],
+    tokens_used: int,
+) -> asyncio.Task:
+    """
+    Schedule a semantic cache write without blocking the response.
+
+    The write embeds the question and upserts it into ChromaDB, so it runs
+    in a tracked background task like the history write.
+
+    Returns:
+        The scheduled task
+    """
+    return _track_write(
+        rag_service.cache_semantic_answer(question, answer, sources, tokens_used)
+    )
+
+
+def _track_write(coro: Awaitable[object]) -> asyncio.Task:
+    """Run a write in the background and keep it until it finishes."""
+    task = asyncio.create_task(coro)
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+    return task
+
+
+async def wait_for_pending_writes() -> None:
+    """Wait for all in-flight background writes to finish."""
+    if _pending_writes:
+        await asyncio.gather(*_pending_writes, return_exceptions=True)
+
+
+async def _retrieve_context(question: str) -> Tuple[List[SourceInfo], str]:
+    """
+    Search the knowledge base for a question.
+
+    Args:
+        question: User question
+
+    Returns:
+        Tuple of (sources, context); both empty if the search fails
+    """
+    try:
+        # One vector search feeds both the sources and the LLM context
+        search_results = await rag_service.search(question)
+        context = rag_service.format_context(search_results)
+        record_rag_search(success=True)
+
+        sources = [
+            SourceInfo(document=source, chunk=chunk[:200] + "..." if len(chunk) > 200 else chunk)
+            for source, chunk, score in search_results
+        ]
+    except Exception as e:
+        logger.error("RAG search failed", error=str(e))
+        record_rag_search(success=False)
+        sources = []
+        context = ""
+    return sources, context
+
+
+def _sources_header(sources: List[dict]) -> str:
+    """
+    Encode answer sources for the ``X-Sources`` header of ``/ask/stream``.
+
+    Header values must be latin-1, so the JSON is ASCII-escaped with the
+    stdlib encoder rather than orjson, which always emits UTF-8.
+    """
+    return json.dumps(sources, separators=(",", ":"))
+
+
+async def _lookup_cached_answer(question: str) -> Optional[dict]:
+    """
+    Look up a cached answer: exact Redis key first, then the semantic cache.
+
+    A semantic hit is copied to the exact cache so repeats of the same
+    paraphrase are served by Redis without embedding the question again.
+
+    Args:
+        question: User's question
+
+    Returns:
+        Cached answer payload or None on a miss
+    """
+    cached = await cache_service.get_cached_answer(question)
+    if cached:
+        return cached
+
+    # Paraphrases of an answered question can still hit the semantic cache
+    cached = await rag_service.get_semantic_answer(question)
+    if cached:
+        await cache_service.set_cached_answer(question, cached)
+    return cached
+
+
+async def _store_answer(
+    question: str,
+    answer: str,
+    sources: List[SourceInfo],
+    tokens_used: int,
+    response_time_ms: int,
+) -> None:
+    """Cache a generated answer; semantic cache and history writes run in the background."""
+    # Dump sources once; shared by the cache payload and the history row
+    sources_dump = _SOURCES_ADAPTER.dump_python(sources)
+
+    try:
+        cache_data = {
+            "answer": answer,
+            "sources": sources_dump,
+            "tokens_used": tokens_used,
+        }
+        await cache_service.set_cached_answer(question, cache_data)
+    except Exception as e:
+        logger.warning("Failed to cache response", error=str(e))
+
+    # Embedding the question and writing to ChromaDB would delay the response
+    schedule_semantic_cache_write(question, answer, sources_dump, tokens_used)
+
+    # Save to history without delaying the response
+    schedule_history_write(
+        question=question,
+        answer=answer,
+        tokens_used=tokens_used,
+        response_time_ms=response_time_ms,
+        sources=sources_dump,
+    )
+
+
+async def _check_service(name: str, check: Callable[[], Awaitable[bool]]) -> str:
+    """
+    Run a single health check with a timeout.
+
+    Args:
+        name: Service name used in logs
+        check: Coroutine function returning True when the service is up
+
+    Returns:
+        "healthy" or "unhealthy"
+    """
+    try:
+        ok = await asyncio.wait_for(check(), timeout=HEALTH_CHECK_TIMEOUT)
+        return "healthy" if ok else "unhealthy"
+    except Exception as e:
+        logger.error(f"{name} health check failed", error=str(e))
+        return "unhealthy"
+
+
 @router.get(
     "/health",
     response_model=HealthCheckResponse,
@@ -69,31 +356,15 @@ def sanitize_filename(filename: str) -> str:
 )
 async def health_check() -> HealthCheckResponse:
     """Check health of all services."""
-    
-    # Check PostgreSQL
-    try:
-        pg_ok = await check_db_connection()
-        postgres_status = "healthy" if pg_ok else "unhealthy"
-    except Exception as e:
-        logger.error("PostgreSQL health check failed", error=str(e))
-        postgres_status = "unhealthy"
-    
-    # Check Redis
-    try:
-        redis_ok = await cache_service.check_connection()
-        redis_status = "healthy" if redis_ok else "unhealthy"
-    except Exception as e:
-        logger.error("Redis health check failed", error=str(e))
-        redis_status = "unhealthy"
-    
-    # Check ChromaDB
-    try:
-        chroma_ok = await rag_service.check_connection()
-        chromadb_status = "healthy" if chroma_ok else "unhealthy"
-    except Exception as e:
-        logger.error("ChromaDB health check failed", error=str(e))
-        chromadb_status = "unhealthy"
-    
+
+    # Probe all dependencies concurrently: latency is the slowest check,
+    # not the sum of all three
+    postgres_status, redis_status, chromadb_status = await asyncio.gather(
+        _check_service("PostgreSQL", check_db_connection),
+        _check_service("Redis", cache_service.check_connection),
+        _check_service("ChromaDB", rag_service.check_connection),
+    )
+
     # Overall status
     all_healthy = all([
         postgres_status == "healthy",
@@ -123,18 +394,15 @@ async def health_check() -> HealthCheckResponse:
     summary="Ask a Question",
     description="Submit a question and get an answer based on SmartTask knowledge base",
 )
-async def ask_question(
-    request: AskRequest,
-    db: AsyncSession = Depends(get_db),
-) -> AskResponse:
+async def ask_question(request: AskRequest) -> AskResponse:
     """
     Process a user question using RAG pipeline.
     
-    1. Check cache for existing answer
+    1. Check cache (exact, then semantic) for existing answer
     2. If not cached, search relevant documents
     3. Generate answer using LLM
     4. Cache the response
-    5. Save to history
+    5. Save to history (in the background)
     """
     start_time = time.time()
     question = request.question.strip()
@@ -143,7 +411,7 @@ async def ask_question(
     
     # Check cache first
     try:
-        cached = await cache_service.get_cached_answer(question)
+        cached = await _lookup_cached_answer(question)
         if cached:
             record_cache_hit()
             return AskResponse(
@@ -159,20 +427,7 @@ async def ask_question(
         record_cache_miss()
     
     # Get relevant context from RAG
-    try:
-        search_results = await rag_service.search(question)
-        context = await rag_service.get_context(question)
-        record_rag_search(success=True)
-
-        sources = [
-            SourceInfo(document=source, chunk=chunk[:200] + "..." if len(chunk) > 200 else chunk)
-            for source, chunk, score in search_results
-        ]
-    except Exception as e:
-        logger.error("RAG search failed", error=str(e))
-        record_rag_search(success=False)
-        sources = []
-        context = ""
+    sources, context = await _retrieve_context(question)
     
     # Generate answer using LLM
     try:
@@ -180,7 +435,7 @@ async def ask_question(
         answer, tokens_used, llm_time = await llm_service.generate_answer(question, context)
         llm_duration = time.time() - llm_start
         record_llm_usage(
-            provider=settings.llm_provider,
+            provider=LLM_PROVIDER,
             tokens=tokens_used,
             duration=llm_duration,
             success=True
@@ -188,7 +443,7 @@ async def ask_question(
     except Exception as e:
         logger.error("LLM generation failed", error=str(e))
         record_llm_usage(
-            provider=settings.llm_provider,
+            provider=LLM_PROVIDER,
             tokens=0,
             duration=0,
             success=False
@@ -209,34 +464,113 @@ async def ask_question(
         cached=False,
     )
     
-    # Cache the response
-    try:
-        cache_data = {
-            "answer": answer,
-            "sources": [s.model_dump() for s in sources],
-            "tokens_used": tokens_used,
-        }
-        await cache_service.set_cached_answer(question, cache_data)
-    except Exception as e:
-        logger.warning("Failed to cache response", error=str(e))
+    # Cache the response and save it to history
+    await _store_answer(question, answer, sources, tokens_used, response_time_ms)
     
-    # Save to history
+    return response
+
+
+@router.post(
+    "/ask/stream",
+    response_class=StreamingResponse,
+    responses={
+        500: {"model": ErrorResponse, "description": "Internal server error"},
+    },
+    summary="Ask a Question (streaming)",
+    description="Submit a question and receive the answer as plain text while it is generated",
+)
+async def ask_question_stream(request: AskRequest) -> StreamingResponse:
+    """
+    Process a user question and stream the answer.
+
+    Runs the same pipeline as ``/ask``, but answer text is sent as soon as
+    the LLM produces it. The ``X-Cached`` header tells whether the answer
+    came from cache; ``X-Sources`` carries the sources as JSON, in the same
+    shape as ``/ask``.
+    """
+    start_time = time.time()
+    question = request.question.strip()
+
+    logger.info("Received streaming question", question=question[:100])
+
+    # Check cache first
     try:
-        history_entry = QueryHistory(
-            question=question,
-            answer=answer,
-            tokens_used=tokens_used,
-            response_time_ms=response_time_ms,
-            sources=[s.model_dump() for s in sources],
+        cached = await _lookup_cached_answer(question)
+    except Exception as e:
+        logger.warning("Cache check failed, continuing without cache", error=str(e))
+        cached = None
+
+    if cached:
+        record_cache_hit()
+        return StreamingResponse(
+            iter([cached["answer"]]),
+            media_type=STREAM_MEDIA_TYPE,
+            headers={"X-Cached": "true", "X-Sources": _sources_header(cached["sources"])},
         )
-        db.add(history_entry)
-        await db.commit()
-        logger.info("Saved to history", query_id=str(history_entry.id))
+    record_cache_miss()
+
+    # Get relevant context from RAG
+    sources, context = await _retrieve_context(question)
+
+    # Wait for the first chunk so failures before any output still get a 500
+    usage = StreamUsage()
+    llm_start = time.time()
+    chunks = llm_service.generate_answer_stream(question, context, usage)
+    try:
+        first_chunk = await anext(chunks, "")
     except Exception as e:
-        logger.warning("Failed to save to history", error=str(e))
-        await db.rollback()
-    
-    return response
+        logger.error("LLM generation failed", error=str(e))
+        record_llm_usage(provider=LLM_PROVIDER, tokens=0, duration=0, success=False)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to generate answer. Please try again later."
+        )
+
+    async def close_chunks():
+        # Starlette runs non-coroutine callables (such as the builtin
+        # aclose) in a thread, which would only create the coroutine
+        await chunks.aclose()
+
+    async def stream_answer():
+        parts = [first_chunk]
+        try:
+            yield first_chunk
+            async for text in chunks:
+                parts.append(text)
+                yield text
+        except Exception as e:
+            # Headers are already sent; end the body early
+            logger.error("LLM streaming failed", error=str(e))
+            record_llm_usage(provider=LLM_PROVIDER, tokens=0, duration=0, success=False)
+            return
+        finally:
+            # Release the provider stream even if the client disconnected
+            await chunks.aclose()
+
+        record_llm_usage(
+            provider=LLM_PROVIDER,
+            tokens=usage.tokens_used,
+            duration=time.time() - llm_start,
+            success=True
+        )
+        await _store_answer(
+            question,
+            "".join(parts),
+            sources,
+            usage.tokens_used,
+            int((time.time() - start_time) * 1000),
+        )
+
+    return StreamingResponse(
+        stream_answer(),
+        media_type=STREAM_MEDIA_TYPE,
+        headers={
+            "X-Cached": "false",
+            "X-Sources": _sources_header(_SOURCES_ADAPTER.dump_python(sources)),
+        },
+        # The body's finally never runs if the client leaves before it starts
+        background=BackgroundTask(close_chunks),
+    )
 
 
 @router.post(
@@ -273,24 +607,33 @@ async def upload_document(
 
     logger.info("Uploading document", filename=safe_filename)
 
-    # Read and validate file size
+    # Read in chunks, validating size and decoding UTF-8 incrementally so
+    # oversized uploads are rejected before they are read in full
     try:
-        content = await file.read()
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        parts: List[str] = []
+        total_size = 0
 
-        # Validate file size
-        if len(content) > MAX_FILE_SIZE_BYTES:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File too large. Maximum size is {MAX_FILE_SIZE_BYTES // (1024 * 1024)} MB"
-            )
+        while chunk := await file.read(UPLOAD_READ_CHUNK_BYTES):
+            total_size += len(chunk)
+
+            # Validate file size
+            if total_size > MAX_FILE_SIZE_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"File too large. Maximum size is {MAX_FILE_SIZE_BYTES // (1024 * 1024)} MB"
+                )
 
-        if len(content) == 0:
+            parts.append(decoder.decode(chunk))
+
+        if total_size == 0:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="File is empty"
             )
 
-        content_str = content.decode('utf-8')
+        parts.append(decoder.decode(b"", final=True))
+        content_str = "".join(parts)
     except UnicodeDecodeError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -327,14 +670,41 @@ async def get_history(
 ) -> List[QueryHistoryItem]:
     """Get recent query history."""
 
+    # Select only the response columns: rows come back as plain mappings,
+    # skipping ORM instance construction and the identity map
     result = await db.execute(
-        select(QueryHistory)
+        select(
+            QueryHistory.id,
+            QueryHistory.question,
+            QueryHistory.answer,
+            QueryHistory.tokens_used,
+            QueryHistory.response_time_ms,
+            QueryHistory.sources,
+            QueryHistory.created_at,
+        )
         .order_by(QueryHistory.created_at.desc())
         .limit(limit)
     )
 
-    items = result.scalars().all()
-    return [QueryHistoryItem.model_validate(item) for item in items]
+    rows = result.mappings().all()
+    return _HISTORY_ADAPTER.validate_python([dict(row) for row in rows])
+
+
+async def _count_queries(db: AsyncSession) -> int:
+    """
+    Count history rows using COUNT.
+
+    COUNT scans the whole table, so the result is memoized in Redis for
+    ``settings.stats_cache_ttl`` seconds.
+    """
+    cached = await cache_service.get_cached_count("query_count")
+    if cached is not None:
+        return cached
+
+    result = await db.execute(select(func.count(QueryHistory.id)))
+    query_count = result.scalar() or 0
+    await cache_service.set_cached_count("query_count", query_count)
+    return query_count
 
 
 @router.get(
@@ -347,19 +717,19 @@ async def get_stats(
 ) -> dict:
     """Get service statistics."""
 
-    # Get RAG stats
-    try:
-        rag_stats = await rag_service.get_collection_stats()
-        doc_count = rag_stats.get("document_count", 0)
-        update_documents_indexed(doc_count)
-    except Exception:
+    # RAG stats and the query count are independent, so fetch them concurrently
+    rag_stats, query_count = await asyncio.gather(
+        rag_service.get_collection_stats(),
+        _count_queries(db),
+        return_exceptions=True,
+    )
+
+    if isinstance(rag_stats, BaseException):
         rag_stats = {"document_count": 0}
+    else:
+        update_documents_indexed(rag_stats.get("document_count", 0))
 
-    # Get query count efficiently using COUNT
-    try:
-        result = await db.execute(select(func.count(QueryHistory.id)))
-        query_count = result.scalar() or 0
-    except Exception:
+    if isinstance(query_count, BaseException):
         query_count = 0
 
     return {
@@ -1,5 +1,6 @@
 """Application configuration module."""
 
+import os
 from functools import lru_cache
 from pydantic_settings import BaseSettings
 from pydantic import Field
@@ -19,11 +20,17 @@ class Settings(BaseSettings):
     postgres_db: str = Field(default="smarttask_faq", env="POSTGRES_DB")
     postgres_user: str = Field(default="postgres", env="POSTGRES_USER")
     postgres_password: str = Field(default="postgres", env="POSTGRES_PASSWORD")
+    postgres_pool_size: int = Field(default=20, env="POSTGRES_POOL_SIZE")
+    postgres_max_overflow: int = Field(default=20, env="POSTGRES_MAX_OVERFLOW")
+    postgres_pool_recycle: int = Field(default=1800, env="POSTGRES_POOL_RECYCLE")
+    postgres_connect_timeout: int = Field(default=10, env="POSTGRES_CONNECT_TIMEOUT")
+    postgres_pgbouncer: bool = Field(default=False, env="POSTGRES_PGBOUNCER")
     
     # Redis
     redis_host: str = Field(default="localhost", env="REDIS_HOST")
     redis_port: int = Field(default=6379, env="REDIS_PORT")
     redis_cache_ttl: int = Field(default=3600, env="REDIS_CACHE_TTL")
+    stats_cache_ttl: int = Field(default=30, env="STATS_CACHE_TTL")
     
     # ChromaDB
     chroma_host: str = Field(default="localhost", env="CHROMA_HOST")
@@ -32,13 +39,26 @@ class Settings(BaseSettings):
     # App settings
     app_host: str = Field(default="0.0.0.0", env="APP_HOST")
     app_port: int = Field(default=8000, env="APP_PORT")
+    app_workers: int = Field(default=os.cpu_count() or 1, env="APP_WORKERS")
     log_level: str = Field(default="INFO", env="LOG_LEVEL")
     debug: bool = Field(default=False, env="DEBUG")
     
+    # LLM answer cache (in-process)
+    llm_cache_size: int = Field(default=1024, env="LLM_CACHE_SIZE")
+    llm_cache_ttl: int = Field(default=3600, env="LLM_CACHE_TTL")
+    llm_warm_up: bool = Field(default=True, env="LLM_WARM_UP")
+    
     # RAG settings
     chunk_size: int = Field(default=500, env="CHUNK_SIZE")
     chunk_overlap: int = Field(default=50, env="CHUNK_OVERLAP")
+    min_chunk_chars: int = Field(default=32, env="MIN_CHUNK_CHARS")
     top_k_results: int = Field(default=3, env="TOP_K_RESULTS")
+    # The default embedding model is English-only, so Russian questions on
+    # different topics can still score above the threshold; opt in explicitly
+    semantic_cache_enabled: bool = Field(default=False, env="SEMANTIC_CACHE_ENABLED")
+    semantic_cache_threshold: float = Field(default=0.92, env="SEMANTIC_CACHE_THRESHOLD")
+    semantic_cache_ttl: int = Field(default=3600, env="SEMANTIC_CACHE_TTL")
+    embedding_cache_ttl: int = Field(default=86400, env="EMBEDDING_CACHE_TTL")
     
     @property
     def database_url(self) -> str:
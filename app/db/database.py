@@ -1,19 +1,49 @@
 """Database configuration and session management."""
 
+import asyncio
+import orjson
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from app.config import get_settings
 
 settings = get_settings()
 
-# Async engine for FastAPI
+# Upper bound for the health-check probe so a wedged server cannot hang /health
+DB_HEALTH_CHECK_TIMEOUT = 1.0  # seconds
+
+
+def _orjson_dumps(value) -> str:
+    """Serialize a value for a JSON/JSONB bind parameter."""
+    return orjson.dumps(value).decode()
+
+
+# JIT compilation only adds latency to the short statements this service runs.
+# pgbouncer in transaction mode cannot keep server-side prepared statements,
+# so both statement caches are disabled behind it.
+_statement_cache_size = 0 if settings.postgres_pgbouncer else 256
+_prepared_statement_cache_size = 0 if settings.postgres_pgbouncer else 64
+
+# Async engine for FastAPI.
+# pool_pre_ping is disabled because it costs an extra SELECT 1 round trip on
+# every checkout; stale connections are replaced via pool_recycle instead.
+# The asyncpg dialect registers its json/jsonb codecs with these (de)serializers
+# on every new connection, so JSON round trips go through orjson.
 async_engine = create_async_engine(
     settings.database_url,
     echo=settings.debug,
-    pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10,
+    pool_pre_ping=False,
+    pool_recycle=settings.postgres_pool_recycle,
+    pool_size=settings.postgres_pool_size,
+    max_overflow=settings.postgres_max_overflow,
+    connect_args={
+        "timeout": settings.postgres_connect_timeout,
+        "server_settings": {"jit": "off", "application_name": "smarttask-faq"},
+        "statement_cache_size": _statement_cache_size,
+        "prepared_statement_cache_size": _prepared_statement_cache_size,
+    },
+    json_serializer=_orjson_dumps,
+    json_deserializer=orjson.loads,
 )
 
 # Async session factory
@@ -51,11 +81,16 @@ async def init_db() -> None:
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def _ping_db() -> None:
+    """Run a trivial query on a pooled connection."""
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
 async def check_db_connection() -> bool:
     """Check if database connection is working."""
     try:
-        async with AsyncSessionLocal() as session:
-            await session.execute("SELECT 1")
+        await asyncio.wait_for(_ping_db(), timeout=DB_HEALTH_CHECK_TIMEOUT)
         return True
     except Exception:
         return False
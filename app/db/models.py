@@ -2,8 +2,8 @@
 
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, Integer, DateTime, Text, JSON, Index
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Integer, DateTime, Text, Index
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from app.db.database import Base
 
 
@@ -14,7 +14,7 @@ class QueryHistory(Base):
     Indexes:
     - Primary key on id (automatic)
     - ix_query_history_created_at_desc: For ORDER BY created_at DESC queries (history listing)
-    - ix_query_history_tokens_created: Composite for analytics queries filtering by tokens
+    - ix_query_history_created_at_brin: BRIN for analytics date-range scans
     - ix_query_history_response_time: For performance monitoring queries
     """
 
@@ -25,7 +25,7 @@ class QueryHistory(Base):
     answer = Column(Text, nullable=False)
     tokens_used = Column(Integer, nullable=False, default=0)
     response_time_ms = Column(Integer, nullable=False, default=0)
-    sources = Column(JSON, nullable=False, default=list)
+    sources = Column(JSONB, nullable=False, default=list)
     created_at = Column(
         DateTime,
         nullable=False,
@@ -40,12 +40,13 @@ class QueryHistory(Base):
             created_at.desc(),
             postgresql_using='btree',
         ),
-        # Composite index for analytics: filter by date range and aggregate tokens
+        # BRIN index for analytics date-range scans: rows are appended in
+        # created_at order, so block ranges map tightly onto time ranges
         Index(
-            'ix_query_history_date_tokens',
+            'ix_query_history_created_at_brin',
             created_at,
-            tokens_used,
-            postgresql_using='btree',
+            postgresql_using='brin',
+            postgresql_with={'pages_per_range': 32},
         ),
         # Index for performance monitoring queries
         Index(
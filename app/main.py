@@ -1,21 +1,28 @@
 """Main FastAPI application module."""
 
 import os
+import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import CONTENT_TYPE_LATEST
 
-from app.api import router
+from app.api import router, wait_for_pending_writes
 from app.config import get_settings
 from app.db import init_db
-from app.services import cache_service, rag_service
-from app.utils import setup_logging, get_logger, init_app_info
+from app.services import cache_service, rag_service, llm_service
+from app.utils import setup_logging, get_logger, init_app_info, render_metrics, mark_worker_dead
 
 settings = get_settings()
 
+# Rendered /metrics body is reused for this long to absorb concurrent scrapes
+METRICS_CACHE_TTL = 1.0  # seconds
+
+# Last rendered body and when it was rendered; mutated in place by /metrics
+_metrics_cache = {"rendered_at": 0.0, "body": b""}
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -55,14 +62,25 @@ async def lifespan(app: FastAPI):
             logger.info("Loaded documents", chunks=chunks)
     except Exception as e:
         logger.warning("Failed to initialize RAG service", error=str(e))
+
+    # Recover ChromaDB in the background instead of in the request path
+    rag_service.start_monitor()
     
+    # Pre-open the TLS connection to the LLM API
+    if settings.llm_warm_up:
+        await llm_service.warm_up()
+
     logger.info("SmartTask FAQ Service started successfully")
     
     yield
     
     # Cleanup
     logger.info("Shutting down SmartTask FAQ Service...")
+    await wait_for_pending_writes()
+    await rag_service.stop_monitor()
     await cache_service.disconnect()
+    await llm_service.close()
+    mark_worker_dead()
 
 
 # Create FastAPI application
@@ -105,8 +123,15 @@ async def root():
 @app.get("/metrics", include_in_schema=False)
 async def metrics():
     """Expose Prometheus metrics."""
+    # Rendering walks every collector; reuse the last body within the TTL.
+    # No await between the check and the update, so this is safe on the loop.
+    now = time.monotonic()
+    if not _metrics_cache["body"] or now - _metrics_cache["rendered_at"] >= METRICS_CACHE_TTL:
+        _metrics_cache["body"] = render_metrics()
+        _metrics_cache["rendered_at"] = now
+
     return Response(
-        content=generate_latest(),
+        content=_metrics_cache["body"],
         media_type=CONTENT_TYPE_LATEST
     )
 
@@ -118,4 +143,8 @@ if __name__ == "__main__":
         host=settings.app_host,
         port=settings.app_port,
         reload=settings.debug,
+        # One event loop per CPU; reload mode only supports a single worker
+        workers=1 if settings.debug else settings.app_workers,
+        loop="uvloop",
+        http="httptools",
     )
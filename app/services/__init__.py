@@ -9,6 +9,7 @@ from app.services.llm_service import (
     AnthropicProvider,
     OpenAIProvider,
     LLMProviderRegistry,
+    StreamUsage,
     SYSTEM_PROMPT,
 )
 
@@ -24,5 +25,6 @@ __all__ = [
     "AnthropicProvider",
     "OpenAIProvider",
     "LLMProviderRegistry",
+    "StreamUsage",
     "SYSTEM_PROMPT",
 ]
@@ -1,9 +1,10 @@
 """Redis cache service for caching FAQ responses."""
 
-import json
-import hashlib
 from typing import Optional
+import numpy as np
+import orjson
 import redis.asyncio as redis
+import xxhash
 from app.config import get_settings
 from app.utils import get_logger
 
@@ -23,7 +24,8 @@ class CacheService:
             self._client = redis.Redis(
                 host=settings.redis_host,
                 port=settings.redis_port,
-                decode_responses=True,
+                # Payloads are (de)serialized with orjson, which works on bytes
+                decode_responses=False,
             )
             logger.info("Connected to Redis", host=settings.redis_host, port=settings.redis_port)
     
@@ -36,9 +38,14 @@ class CacheService:
     
     @staticmethod
     def _hash_question(question: str) -> str:
-        """Generate a hash key for a question."""
+        """
+        Generate a hash key for a question.
+
+        The key is only used for cache lookups, so a fast non-cryptographic
+        128-bit hash (XXH3) is used instead of SHA-256.
+        """
         normalized = question.lower().strip()
-        return f"faq:{hashlib.sha256(normalized.encode()).hexdigest()}"
+        return f"faq:{xxhash.xxh3_128_hexdigest(normalized.encode())}"
     
     async def get_cached_answer(self, question: str) -> Optional[dict]:
         """
@@ -58,7 +65,7 @@ class CacheService:
             cached = await self._client.get(key)
             if cached:
                 logger.info("Cache hit", question_hash=key[:20])
-                return json.loads(cached)
+                return orjson.loads(cached)
             logger.debug("Cache miss", question_hash=key[:20])
             return None
         except Exception as e:
@@ -89,13 +96,116 @@ class CacheService:
         ttl = ttl or settings.redis_cache_ttl
         
         try:
-            await self._client.setex(key, ttl, json.dumps(answer))
+            await self._client.setex(key, ttl, orjson.dumps(answer))
             logger.info("Cached answer", question_hash=key[:20], ttl=ttl)
             return True
         except Exception as e:
             logger.error("Error setting cache", error=str(e))
             return False
     
+    @classmethod
+    def _embedding_key(cls, question: str) -> str:
+        """Redis key of a question's embedding; same normalization as the answer key."""
+        return "emb:" + cls._hash_question(question).removeprefix("faq:")
+
+    async def get_cached_embedding(self, question: str) -> Optional[np.ndarray]:
+        """
+        Get the cached embedding of a question.
+
+        Args:
+            question: The user's question
+
+        Returns:
+            float32 embedding or None if missing or Redis is unavailable
+        """
+        if not self._client:
+            await self.connect()
+
+        try:
+            cached = await self._client.get(self._embedding_key(question))
+            if cached is None:
+                return None
+            return np.frombuffer(cached, dtype=np.float32)
+        except Exception as e:
+            logger.error("Error getting embedding from cache", error=str(e))
+            return None
+
+    async def set_cached_embedding(
+        self,
+        question: str,
+        embedding: np.ndarray,
+        ttl: Optional[int] = None,
+    ) -> bool:
+        """
+        Cache the embedding of a question.
+
+        Stored as raw float32 bytes, the same precision the model returns,
+        so a vector read from Redis equals the one computed in-process.
+
+        Args:
+            question: The user's question
+            embedding: Embedding vector
+            ttl: Time to live in seconds (default from settings)
+
+        Returns:
+            True if cached successfully
+        """
+        if not self._client:
+            await self.connect()
+
+        try:
+            await self._client.setex(
+                self._embedding_key(question),
+                ttl or settings.embedding_cache_ttl,
+                np.asarray(embedding, dtype=np.float32).tobytes(),
+            )
+            return True
+        except Exception as e:
+            logger.error("Error caching embedding", error=str(e))
+            return False
+
+    async def get_cached_count(self, name: str) -> Optional[int]:
+        """
+        Get a cached counter value (e.g. the result of an expensive COUNT).
+
+        Args:
+            name: Counter name
+
+        Returns:
+            Cached value or None if missing or Redis is unavailable
+        """
+        if not self._client:
+            await self.connect()
+
+        try:
+            cached = await self._client.get(f"stats:{name}")
+            return int(cached) if cached is not None else None
+        except Exception as e:
+            logger.error("Error getting counter from cache", name=name, error=str(e))
+            return None
+
+    async def set_cached_count(self, name: str, value: int, ttl: Optional[int] = None) -> bool:
+        """
+        Cache a counter value for a short time.
+
+        Args:
+            name: Counter name
+            value: Counter value
+            ttl: Time to live in seconds (default from settings)
+
+        Returns:
+            True if cached successfully
+        """
+        if not self._client:
+            await self.connect()
+
+        try:
+            await self._client.setex(f"stats:{name}", ttl or settings.stats_cache_ttl, value)
+            return True
+        except Exception as e:
+            logger.error("Error setting counter in cache", name=name, error=str(e))
+            return False
+
     async def check_connection(self) -> bool:
         """Check if Redis connection is working."""
         try:
@@ -1,8 +1,14 @@
 """LLM service for generating answers using pluggable providers (Strategy pattern)."""
 
+import asyncio
 import time
+from functools import lru_cache
 from abc import ABC, abstractmethod
-from typing import Tuple, Optional, Dict
+from dataclasses import dataclass
+from typing import AsyncIterator, Tuple, Optional, Dict
+import orjson
+import xxhash
+from cachetools import TTLCache
 from tenacity import retry, stop_after_attempt, wait_exponential
 from app.config import get_settings
 from app.utils import get_logger
@@ -23,6 +29,44 @@ SYSTEM_PROMPT = """Ты - помощник по продукту SmartTask, об
 4. Если вопрос касается нескольких тем - структурируй ответ.
 5. Не выдумывай информацию, которой нет в контексте."""
 
+# User message wrapped around the RAG context and the question
+USER_PROMPT_TEMPLATE = """Контекст из базы знаний:
+{context}
+
+Вопрос пользователя: {question}
+
+Ответь на вопрос, используя только информацию из контекста."""
+
+NO_CONTEXT_PLACEHOLDER = "Контекст не найден."
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Load the tiktoken encoding once; None if tiktoken is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("tiktoken unavailable, estimating token counts", error=str(e))
+        return None
+
+
+@lru_cache(maxsize=1024)
+def _count_tokens(text: str) -> int:
+    """Count tokens in text; repeated prompts are served from the LRU cache."""
+    encoding = _get_encoding()
+    if encoding is None:
+        # Rough estimate: ~4 characters per token
+        return len(text) // 4
+    # encode_ordinary skips the special-token scan; special tokens count as text
+    return len(encoding.encode_ordinary(text))
+
+
+@dataclass
+class StreamUsage:
+    """Token usage of a streamed answer, filled in once the stream ends."""
+    tokens_used: int = 0
+
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers (Strategy interface)."""
@@ -61,6 +105,65 @@ class LLMProvider(ABC):
         """
         pass
 
+    async def agenerate(
+        self,
+        user_message: str,
+        system_prompt: str,
+        max_tokens: int = 1024,
+        model: Optional[str] = None,
+    ) -> Tuple[str, int]:
+        """
+        Generate a response without blocking the event loop.
+
+        The default runs the blocking ``generate`` in a worker thread;
+        providers with an async SDK client override this.
+
+        Returns:
+            Tuple of (response_text, tokens_used)
+        """
+        return await asyncio.to_thread(
+            self.generate, user_message, system_prompt, max_tokens, model
+        )
+
+    async def astream(
+        self,
+        user_message: str,
+        system_prompt: str,
+        usage: StreamUsage,
+        max_tokens: int = 1024,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response as text chunks.
+
+        The default yields the complete ``agenerate`` answer as one chunk;
+        providers with a streaming API override this.
+
+        Args:
+            user_message: The user's message/prompt
+            system_prompt: The system prompt to use
+            usage: Receives the token count when the stream ends
+            max_tokens: Maximum tokens in response
+            model: Optional model override
+
+        Yields:
+            Chunks of response text
+        """
+        answer, usage.tokens_used = await self.agenerate(
+            user_message, system_prompt, max_tokens, model
+        )
+        yield answer
+
+    async def warm_up(self) -> None:
+        """Open a connection to the provider API ahead of the first request."""
+        # Optional hook: no-op for providers without a connection pool
+        return None
+
+    async def aclose(self) -> None:
+        """Release network resources held by the provider."""
+        # Optional hook: no-op for providers without a connection pool
+        return None
+
     @abstractmethod
     def is_configured(self) -> bool:
         """Check if the provider is properly configured (API key set)."""
@@ -72,6 +175,10 @@ class AnthropicProvider(LLMProvider):
 
     def __init__(self):
         self._client = None
+        self._async_client = None
+        self._http_client = None
+        # Read once: settings do not change while the process runs
+        self._api_key = settings.anthropic_api_key
 
     @property
     def name(self) -> str:
@@ -85,9 +192,22 @@ class AnthropicProvider(LLMProvider):
         """Lazy initialization of Anthropic client."""
         if self._client is None:
             import anthropic
-            self._client = anthropic.Anthropic(api_key=settings.anthropic_api_key)
+            self._client = anthropic.Anthropic(api_key=self._api_key)
         return self._client
 
+    def _get_async_client(self):
+        """Lazy initialization of async Anthropic client with a pooled HTTP/2 transport."""
+        if self._async_client is None:
+            import anthropic
+            # Built from the SDK's own client class so it keeps the SDK's
+            # timeouts and keepalive settings
+            self._http_client = anthropic.DefaultAsyncHttpxClient(http2=True)
+            self._async_client = anthropic.AsyncAnthropic(
+                api_key=self._api_key,
+                http_client=self._http_client,
+            )
+        return self._async_client
+
     def generate(
         self,
         user_message: str,
@@ -106,6 +226,55 @@ class AnthropicProvider(LLMProvider):
             messages=[{"role": "user", "content": user_message}]
         )
 
+        return self._parse_response(response, model)
+
+    async def agenerate(
+        self,
+        user_message: str,
+        system_prompt: str,
+        max_tokens: int = 1024,
+        model: Optional[str] = None,
+    ) -> Tuple[str, int]:
+        """Generate response using the async Anthropic client."""
+        client = self._get_async_client()
+        model = model or self.default_model
+
+        response = await client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            system=system_prompt,
+            messages=[{"role": "user", "content": user_message}]
+        )
+
+        return self._parse_response(response, model)
+
+    async def astream(
+        self,
+        user_message: str,
+        system_prompt: str,
+        usage: StreamUsage,
+        max_tokens: int = 1024,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Stream response text using the Anthropic Messages streaming API."""
+        client = self._get_async_client()
+        model = model or self.default_model
+
+        async with client.messages.stream(
+            model=model,
+            max_tokens=max_tokens,
+            system=system_prompt,
+            messages=[{"role": "user", "content": user_message}]
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            final = await stream.get_final_message()
+
+        usage.tokens_used = final.usage.input_tokens + final.usage.output_tokens
+
+    @staticmethod
+    def _parse_response(response, model: str) -> Tuple[str, int]:
+        """Extract answer text and token usage from a Messages API response."""
         answer = response.content[0].text
         tokens = response.usage.input_tokens + response.usage.output_tokens
 
@@ -118,9 +287,21 @@ class AnthropicProvider(LLMProvider):
 
         return answer, tokens
 
+    async def warm_up(self) -> None:
+        """Complete the TLS handshake with the API host before the first request."""
+        client = self._get_async_client()
+        await self._http_client.head(str(client.base_url))
+
+    async def aclose(self) -> None:
+        """Close the async client and its connection pool."""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self._http_client = None
+
     def is_configured(self) -> bool:
         """Check if Anthropic API key is configured."""
-        return bool(settings.anthropic_api_key)
+        return bool(self._api_key)
 
 
 class OpenAIProvider(LLMProvider):
@@ -128,6 +309,9 @@ class OpenAIProvider(LLMProvider):
 
     def __init__(self):
         self._client = None
+        self._async_client = None
+        self._http_client = None
+        self._api_key = settings.openai_api_key
 
     @property
     def name(self) -> str:
@@ -141,9 +325,22 @@ class OpenAIProvider(LLMProvider):
         """Lazy initialization of OpenAI client."""
         if self._client is None:
             import openai
-            self._client = openai.OpenAI(api_key=settings.openai_api_key)
+            self._client = openai.OpenAI(api_key=self._api_key)
         return self._client
 
+    def _get_async_client(self):
+        """Lazy initialization of async OpenAI client with a pooled HTTP/2 transport."""
+        if self._async_client is None:
+            import openai
+            # Built from the SDK's own client class so it keeps the SDK's
+            # timeouts and keepalive settings
+            self._http_client = openai.DefaultAsyncHttpxClient(http2=True)
+            self._async_client = openai.AsyncOpenAI(
+                api_key=self._api_key,
+                http_client=self._http_client,
+            )
+        return self._async_client
+
     def generate(
         self,
         user_message: str,
@@ -164,6 +361,63 @@ class OpenAIProvider(LLMProvider):
             ]
         )
 
+        return self._parse_response(response, model)
+
+    async def agenerate(
+        self,
+        user_message: str,
+        system_prompt: str,
+        max_tokens: int = 1024,
+        model: Optional[str] = None,
+    ) -> Tuple[str, int]:
+        """Generate response using the async OpenAI client."""
+        client = self._get_async_client()
+        model = model or self.default_model
+
+        response = await client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message}
+            ]
+        )
+
+        return self._parse_response(response, model)
+
+    async def astream(
+        self,
+        user_message: str,
+        system_prompt: str,
+        usage: StreamUsage,
+        max_tokens: int = 1024,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Stream response text using OpenAI chat completion chunks."""
+        client = self._get_async_client()
+        model = model or self.default_model
+
+        stream = await client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message}
+            ],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        async for chunk in stream:
+            # The final chunk carries usage and no choices
+            if chunk.usage is not None:
+                usage.tokens_used = chunk.usage.total_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    @staticmethod
+    def _parse_response(response, model: str) -> Tuple[str, int]:
+        """Extract answer text and token usage from a chat completion."""
         answer = response.choices[0].message.content
         tokens = response.usage.total_tokens
 
@@ -175,9 +429,21 @@ class OpenAIProvider(LLMProvider):
 
         return answer, tokens
 
+    async def warm_up(self) -> None:
+        """Complete the TLS handshake with the API host before the first request."""
+        client = self._get_async_client()
+        await self._http_client.head(str(client.base_url))
+
+    async def aclose(self) -> None:
+        """Close the async client and its connection pool."""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self._http_client = None
+
     def is_configured(self) -> bool:
         """Check if OpenAI API key is configured."""
-        return bool(settings.openai_api_key)
+        return bool(self._api_key)
 
 
 class LLMProviderRegistry:
@@ -185,10 +451,13 @@ class LLMProviderRegistry:
 
     def __init__(self):
         self._providers: Dict[str, LLMProvider] = {}
+        # Configured provider names; rebuilt only after a registration
+        self._available: Optional[Tuple[str, ...]] = None
 
     def register(self, provider: LLMProvider) -> None:
         """Register a provider."""
         self._providers[provider.name] = provider
+        self._available = None
         logger.debug("Registered LLM provider", provider=provider.name)
 
     def get(self, name: str) -> Optional[LLMProvider]:
@@ -197,10 +466,12 @@ class LLMProviderRegistry:
 
     def get_available(self) -> list[str]:
         """Get list of available (configured) provider names."""
-        return [
-            name for name, provider in self._providers.items()
-            if provider.is_configured()
-        ]
+        if self._available is None:
+            self._available = tuple(
+                name for name, provider in self._providers.items()
+                if provider.is_configured()
+            )
+        return list(self._available)
 
     def list_all(self) -> list[str]:
         """Get list of all registered provider names."""
@@ -220,6 +491,13 @@ class LLMService:
         self._registry = LLMProviderRegistry()
         self._current_provider: Optional[LLMProvider] = None
         self._system_prompt = SYSTEM_PROMPT
+        # Exact-match answer cache: key -> (answer, tokens_used)
+        self._cache: TTLCache = TTLCache(
+            maxsize=settings.llm_cache_size,
+            ttl=settings.llm_cache_ttl,
+        )
+        # Provider calls currently running: key -> future of (answer, tokens_used)
+        self._inflight: Dict[str, asyncio.Future] = {}
 
         # Register default providers
         self._registry.register(AnthropicProvider())
@@ -287,6 +565,50 @@ class LLMService:
         """Get list of available (configured) providers."""
         return self._registry.get_available()
 
+    async def warm_up(self) -> None:
+        """Pre-open the connection to the active provider; failures are ignored."""
+        if self._current_provider is None:
+            return
+        try:
+            await self._current_provider.warm_up()
+        except Exception as e:
+            logger.warning(
+                "LLM connection warm-up failed",
+                provider=self._current_provider.name,
+                error=str(e),
+            )
+
+    async def close(self) -> None:
+        """Close the connection pools of all registered providers; failures are ignored."""
+        for name in self._registry.list_all():
+            try:
+                await self._registry.get(name).aclose()
+            except Exception as e:
+                logger.warning("Failed to close LLM provider", provider=name, error=str(e))
+
+    def clear_cache(self) -> None:
+        """Drop all cached answers."""
+        self._cache.clear()
+
+    def _cache_key(
+        self,
+        provider: LLMProvider,
+        question: str,
+        context: str,
+        max_tokens: int,
+        model: Optional[str],
+    ) -> str:
+        """Build the answer cache key from everything that shapes the prompt."""
+        payload = orjson.dumps([
+            provider.name,
+            model or provider.default_model,
+            self._system_prompt,
+            max_tokens,
+            context,
+            question,
+        ])
+        return xxhash.xxh3_128_hexdigest(payload)
+
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
     async def generate_answer(
         self,
@@ -310,20 +632,41 @@ class LLMService:
         Raises:
             RuntimeError: If no provider is configured
         """
-        if self._current_provider is None:
+        # Resolve the provider and its name once: the strategy stays fixed for
+        # the whole call even if set_provider runs while the request is awaiting
+        provider = self._current_provider
+        if provider is None:
             raise RuntimeError("No LLM provider configured")
+        provider_name = provider.name
+
+        context = context or NO_CONTEXT_PLACEHOLDER
+
+        # Identical prompts get identical answers; skip the provider round trip
+        cache_key = self._cache_key(provider, question, context, max_tokens, model)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            answer, tokens = cached
+            logger.debug("LLM cache hit", provider=provider_name)
+            return answer, tokens, 0
 
         start_time = time.time()
 
-        user_message = f"""Контекст из базы знаний:
-{context if context else "Контекст не найден."}
+        # Concurrent identical prompts share one provider call; shield so a
+        # disconnecting follower does not cancel the shared result
+        pending = self._inflight.get(cache_key)
+        if pending is not None:
+            answer, tokens = await asyncio.shield(pending)
+            logger.debug("Joined in-flight LLM call", provider=provider_name)
+            return answer, tokens, int((time.time() - start_time) * 1000)
 
-Вопрос пользователя: {question}
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = pending
 
-Ответь на вопрос, используя только информацию из контекста."""
+        user_message = USER_PROMPT_TEMPLATE.format(context=context, question=question)
 
         try:
-            answer, tokens = self._current_provider.generate(
+            # Never call the blocking SDK on the event loop
+            answer, tokens = await provider.agenerate(
                 user_message=user_message,
                 system_prompt=self._system_prompt,
                 max_tokens=max_tokens,
@@ -331,10 +674,12 @@ class LLMService:
             )
 
             response_time = int((time.time() - start_time) * 1000)
+            self._cache[cache_key] = (answer, tokens)
+            pending.set_result((answer, tokens))
 
             logger.info(
                 "Generated answer",
-                provider=self._current_provider.name,
+                provider=provider_name,
                 tokens=tokens,
                 response_time_ms=response_time,
             )
@@ -344,11 +689,104 @@ class LLMService:
         except Exception as e:
             logger.error(
                 "Error generating answer",
-                provider=self._current_provider.name,
+                provider=provider_name,
+                error=str(e)
+            )
+            self._fail_pending(pending, e)
+            raise
+
+        except asyncio.CancelledError:
+            # Followers retry on their own instead of being cancelled with us
+            self._fail_pending(pending, RuntimeError("LLM call was cancelled"))
+            raise
+
+        finally:
+            self._inflight.pop(cache_key, None)
+
+    @staticmethod
+    def _fail_pending(pending: asyncio.Future, error: Exception) -> None:
+        """Pass a provider error on to callers waiting on the same prompt."""
+        pending.set_exception(error)
+        # Mark the exception as retrieved so an unawaited future is not logged
+        pending.exception()
+
+    async def generate_answer_stream(
+        self,
+        question: str,
+        context: str,
+        usage: Optional[StreamUsage] = None,
+        max_tokens: int = 1024,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream an answer using the configured LLM provider.
+
+        Chunks are yielded as soon as the provider produces them. Unlike
+        ``generate_answer`` the call is not retried, since part of the answer
+        may already have been sent. A completed answer is stored in the same
+        cache as ``generate_answer`` results.
+
+        Args:
+            question: User's question
+            context: Relevant context from RAG
+            usage: Receives the token count when the stream ends
+            max_tokens: Maximum tokens in response
+            model: Optional model override
+
+        Yields:
+            Chunks of answer text
+
+        Raises:
+            RuntimeError: If no provider is configured
+        """
+        provider = self._current_provider
+        if provider is None:
+            raise RuntimeError("No LLM provider configured")
+        provider_name = provider.name
+        usage = usage if usage is not None else StreamUsage()
+
+        context = context or NO_CONTEXT_PLACEHOLDER
+
+        cache_key = self._cache_key(provider, question, context, max_tokens, model)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            answer, usage.tokens_used = cached
+            logger.debug("LLM cache hit", provider=provider_name)
+            yield answer
+            return
+
+        start_time = time.time()
+
+        user_message = USER_PROMPT_TEMPLATE.format(context=context, question=question)
+
+        parts = []
+        try:
+            async for text in provider.astream(
+                user_message=user_message,
+                system_prompt=self._system_prompt,
+                usage=usage,
+                max_tokens=max_tokens,
+                model=model,
+            ):
+                parts.append(text)
+                yield text
+        except Exception as e:
+            logger.error(
+                "Error streaming answer",
+                provider=provider_name,
                 error=str(e)
             )
             raise
 
+        self._cache[cache_key] = ("".join(parts), usage.tokens_used)
+
+        logger.info(
+            "Streamed answer",
+            provider=provider_name,
+            tokens=usage.tokens_used,
+            response_time_ms=int((time.time() - start_time) * 1000),
+        )
+
     def count_tokens(self, text: str) -> int:
         """
         Estimate token count for text.
@@ -359,13 +797,7 @@ class LLMService:
         Returns:
             Estimated token count
         """
-        try:
-            import tiktoken
-            encoding = tiktoken.get_encoding("cl100k_base")
-            return len(encoding.encode(text))
-        except Exception:
-            # Rough estimate: ~4 characters per token
-            return len(text) // 4
+        return _count_tokens(text)
 
 
 # Global LLM service instance
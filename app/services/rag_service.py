@@ -1,17 +1,30 @@
 """RAG (Retrieval-Augmented Generation) service using ChromaDB."""
 
 import asyncio
+import bisect
+import contextlib
 import os
+import re
 import time
-from typing import List, Optional, Tuple
+from typing import Any, ClassVar, Dict, List, Optional, Tuple
+import aiofiles
 import chromadb
+import numpy as np
+import orjson
+from cachetools import LRUCache
 from chromadb.config import Settings as ChromaSettings
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
 from app.config import get_settings
+from app.services.cache_service import CacheService, cache_service
 from app.utils import get_logger
 
 logger = get_logger(__name__)
 settings = get_settings()
 
+# Characters a chunk may end on when splitting documents; FAQ text is full
+# of questions, so '?' and '!' end sentences as well as '.'
+_BOUNDARY_RE = re.compile(r'[.!?\n]')
+
 
 class ChromaDBUnavailableError(Exception):
     """Raised when ChromaDB is unavailable and operation cannot proceed."""
@@ -22,16 +35,38 @@ class RAGService:
     """Service for RAG operations with ChromaDB vector store."""
 
     COLLECTION_NAME = "smarttask_docs"
+    QUERY_CACHE_COLLECTION_NAME = "faq_query_cache"
     MAX_RECONNECT_ATTEMPTS = 3
     RECONNECT_BASE_DELAY = 1.0  # seconds
+    CIRCUIT_COOLDOWN = 30.0  # seconds
+    EMBEDDING_MEMO_SIZE = 1024
+    # HNSW index tuned for text embeddings: denser graph and a wider search
+    # beam than Chroma's defaults (M=16, construction_ef=100, search_ef=10).
+    # get_or_create_collection applies these only when it creates the
+    # collection: an existing one keeps its old graph until it is recreated
+    # (delete it and re-upload the documents)
+    HNSW_METADATA: ClassVar[Dict[str, Any]] = {
+        "hnsw:space": "cosine",
+        "hnsw:M": 32,
+        "hnsw:construction_ef": 200,
+        "hnsw:search_ef": 64,
+    }
 
     def __init__(self):
         self._client: Optional[chromadb.HttpClient] = None
         self._collection = None
+        self._query_cache = None
         self._available: bool = False
         self._last_error: Optional[str] = None
         self._last_error_time: Optional[float] = None
         self._reconnect_attempts: int = 0
+        self._circuit_open_until: float = 0.0
+        self._monitor_task: Optional[asyncio.Task] = None
+        # Same embedding function the collections use, so query vectors
+        # computed here match what Chroma would compute from query_texts
+        self._embedding_fn = DefaultEmbeddingFunction()
+        # Question embeddings by normalized question hash
+        self._embeddings: LRUCache = LRUCache(maxsize=self.EMBEDDING_MEMO_SIZE)
 
     @property
     def is_available(self) -> bool:
@@ -42,6 +77,20 @@ class RAGService:
     def last_error(self) -> Optional[str]:
         """Get the last error message if any."""
         return self._last_error
+
+    @property
+    def circuit_open(self) -> bool:
+        """Check if reconnect attempts are currently suspended."""
+        return time.monotonic() < self._circuit_open_until
+
+    def _open_circuit(self) -> None:
+        """Suspend reconnect attempts from the request path for a cooldown period."""
+        self._circuit_open_until = time.monotonic() + self.CIRCUIT_COOLDOWN
+        logger.warning(
+            "ChromaDB circuit opened",
+            attempts=self._reconnect_attempts,
+            cooldown=self.CIRCUIT_COOLDOWN
+        )
     
     async def connect(self) -> None:
         """Connect to ChromaDB."""
@@ -49,18 +98,13 @@ class RAGService:
             return
 
         try:
-            self._client = chromadb.HttpClient(
-                host=settings.chroma_host,
-                port=settings.chroma_port,
-                settings=ChromaSettings(anonymized_telemetry=False),
-            )
-            self._collection = self._client.get_or_create_collection(
-                name=self.COLLECTION_NAME,
-                metadata={"hnsw:space": "cosine"}
+            self._client, self._collection, self._query_cache = await asyncio.to_thread(
+                self._open_collections
             )
             self._available = True
             self._last_error = None
             self._reconnect_attempts = 0
+            self._circuit_open_until = 0.0
             logger.info(
                 "Connected to ChromaDB",
                 host=settings.chroma_host,
@@ -73,9 +117,36 @@ class RAGService:
             self._last_error_time = time.time()
             self._client = None
             self._collection = None
+            self._query_cache = None
             logger.error("Failed to connect to ChromaDB", error=str(e))
             raise
 
+    def _open_collections(self):
+        """
+        Create the HTTP client and open both collections.
+
+        Blocking; called from a worker thread by ``connect``.
+
+        Returns:
+            Tuple of (client, documents collection, query cache collection)
+        """
+        client = chromadb.HttpClient(
+            host=settings.chroma_host,
+            port=settings.chroma_port,
+            settings=ChromaSettings(anonymized_telemetry=False),
+        )
+        collection = client.get_or_create_collection(
+            name=self.COLLECTION_NAME,
+            metadata=self.HNSW_METADATA,
+            embedding_function=self._embedding_fn,
+        )
+        query_cache = client.get_or_create_collection(
+            name=self.QUERY_CACHE_COLLECTION_NAME,
+            metadata=self.HNSW_METADATA,
+            embedding_function=self._embedding_fn,
+        )
+        return client, collection, query_cache
+
     async def _try_reconnect(self) -> bool:
         """
         Attempt to reconnect to ChromaDB with exponential backoff.
@@ -84,10 +155,7 @@ class RAGService:
             True if reconnection successful, False otherwise
         """
         if self._reconnect_attempts >= self.MAX_RECONNECT_ATTEMPTS:
-            logger.warning(
-                "Max reconnection attempts reached",
-                attempts=self._reconnect_attempts
-            )
+            self._open_circuit()
             return False
 
         delay = self.RECONNECT_BASE_DELAY * (2 ** self._reconnect_attempts)
@@ -111,6 +179,8 @@ class RAGService:
                 attempt=self._reconnect_attempts,
                 error=str(e)
             )
+            if self._reconnect_attempts >= self.MAX_RECONNECT_ATTEMPTS:
+                self._open_circuit()
             return False
 
     async def _ensure_connection(self) -> bool:
@@ -123,10 +193,20 @@ class RAGService:
         if self._available and self._client is not None:
             return True
 
+        # Fail fast while the circuit is open; the monitor probes in the background
+        if self.circuit_open:
+            return False
+
         # Try to reconnect
         return await self._try_reconnect()
     
-    def _chunk_text(self, text: str, chunk_size: int = None, overlap: int = None) -> List[str]:
+    def _chunk_text(
+        self,
+        text: str,
+        chunk_size: Optional[int] = None,
+        overlap: Optional[int] = None,
+        min_chars: Optional[int] = None,
+    ) -> List[str]:
         """
         Split text into overlapping chunks.
         
@@ -134,34 +214,49 @@ class RAGService:
             text: Text to split
             chunk_size: Size of each chunk (default from settings)
             overlap: Overlap between chunks (default from settings)
+            min_chars: Shorter chunks are dropped when the previous chunk
+                already contains them (default from settings)
             
         Returns:
             List of text chunks
         """
         chunk_size = chunk_size or settings.chunk_size
         overlap = overlap or settings.chunk_overlap
+        if min_chars is None:
+            min_chars = settings.min_chunk_chars
         
-        chunks = []
+        offsets: List[Tuple[int, int]] = []
         start = 0
         text = text.strip()
+        text_len = len(text)
+
+        # Find every sentence boundary in one regex pass instead of
+        # rescanning each chunk with rfind
+        boundaries = [m.start() for m in _BOUNDARY_RE.finditer(text)]
         
-        while start < len(text):
+        while start < text_len:
             end = start + chunk_size
-            chunk = text[start:end]
             
             # Try to break at sentence boundary
-            if end < len(text):
-                last_period = chunk.rfind('.')
-                last_newline = chunk.rfind('\n')
-                break_point = max(last_period, last_newline)
-                if break_point > chunk_size // 2:
-                    chunk = chunk[:break_point + 1]
-                    end = start + break_point + 1
+            if end < text_len:
+                idx = bisect.bisect_left(boundaries, end)
+                if idx and boundaries[idx - 1] - start > chunk_size // 2:
+                    end = boundaries[idx - 1] + 1
             
-            chunks.append(chunk.strip())
+            offsets.append((start, end))
+            if end >= text_len:
+                # The rest would only repeat the overlap
+                break
             start = end - overlap
         
-        return [c for c in chunks if c]  # Filter empty chunks
+        # Materialize each chunk once. A tiny fragment only adds noise to
+        # search, but is kept unless the previous chunk already holds all of
+        # it, so a document's tail is never lost
+        chunks = [text[a:b].strip() for a, b in offsets]
+        return [
+            c for i, c in enumerate(chunks)
+            if c and (i == 0 or len(c) >= min_chars or c not in chunks[i - 1])
+        ]
     
     async def add_document(self, filename: str, content: str) -> int:
         """
@@ -174,6 +269,26 @@ class RAGService:
         Returns:
             Number of chunks created
 
+        Raises:
+            ChromaDBUnavailableError: If ChromaDB is unavailable after reconnection attempts
+        """
+        return await self.add_documents([(filename, content)])
+
+    async def add_documents(self, documents: List[Tuple[str, str]]) -> int:
+        """
+        Add several documents to the vector store in one batch.
+
+        Chunk IDs are deterministic (``{filename}_{index}``), so new chunks
+        overwrite the old ones with ``upsert`` in as few calls as Chroma's
+        batch size allows; one delete then drops leftover chunks of documents
+        that got shorter. Documents are never briefly missing from search.
+
+        Args:
+            documents: List of (filename, content) pairs
+
+        Returns:
+            Total number of chunks created
+
         Raises:
             ChromaDBUnavailableError: If ChromaDB is unavailable after reconnection attempts
         """
@@ -183,40 +298,94 @@ class RAGService:
                     f"ChromaDB is unavailable. Last error: {self._last_error}"
                 )
 
-        chunks = self._chunk_text(content)
+        filenames: List[str] = []
+        stale_filters: List[dict] = []
+        # Chunk columns; ids and metadata dicts are built per upsert batch
+        all_chunks: List[str] = []
+        all_sources: List[str] = []
+        all_indices: List[int] = []
+
+        for filename, content in documents:
+            chunks = self._chunk_text(content)
+            if not chunks:
+                logger.warning("No chunks created from document", filename=filename)
+                continue
+
+            filenames.append(filename)
+            stale_filters.append(
+                {"$and": [{"source": filename}, {"chunk_index": {"$gte": len(chunks)}}]}
+            )
+            all_chunks.extend(chunks)
+            all_sources.extend([filename] * len(chunks))
+            all_indices.extend(range(len(chunks)))
 
-        if not chunks:
-            logger.warning("No chunks created from document", filename=filename)
+        if not all_chunks:
             return 0
 
-        ids = [f"{filename}_{i}" for i in range(len(chunks))]
-        metadatas = [{"source": filename, "chunk_index": i} for i in range(len(chunks))]
+        def write_chunks() -> None:
+            # Overwrite chunks in place
+            batch_size = self._client.get_max_batch_size()
+            for i in range(0, len(all_chunks), batch_size):
+                batch = slice(i, i + batch_size)
+                pairs = list(zip(all_sources[batch], all_indices[batch]))
+                self._collection.upsert(
+                    documents=all_chunks[batch],
+                    ids=[f"{source}_{index}" for source, index in pairs],
+                    metadatas=[
+                        {"source": source, "chunk_index": index} for source, index in pairs
+                    ],
+                )
 
-        try:
-            # Delete existing chunks for this document
-            existing = self._collection.get(where={"source": filename})
-            if existing["ids"]:
-                self._collection.delete(ids=existing["ids"])
-                logger.info("Deleted existing chunks", filename=filename, count=len(existing["ids"]))
-
-            # Add new chunks
-            self._collection.add(
-                documents=chunks,
-                ids=ids,
-                metadatas=metadatas,
+            # Drop chunks past the new end of each document
+            self._collection.delete(
+                where=stale_filters[0] if len(stale_filters) == 1 else {"$or": stale_filters}
             )
 
-            logger.info("Added document to vector store", filename=filename, chunks=len(chunks))
-            return len(chunks)
+        try:
+            await asyncio.to_thread(write_chunks)
+
+            logger.info(
+                "Added documents to vector store",
+                documents=len(filenames),
+                chunks=len(all_chunks),
+            )
+            return len(all_chunks)
 
         except Exception as e:
             # Mark as unavailable on connection-related errors
             self._available = False
             self._last_error = str(e)
             self._last_error_time = time.time()
-            logger.error("Error adding document", filename=filename, error=str(e))
+            logger.error("Error adding documents", filenames=filenames, error=str(e))
             raise ChromaDBUnavailableError(f"Failed to add document: {e}")
     
+    async def embed_query(self, query: str) -> np.ndarray:
+        """
+        Embed a question, reusing earlier embeddings of the same question.
+
+        One /ask miss needs the question's embedding three times (semantic
+        cache lookup, search, semantic cache write); it is computed once and
+        kept in process and in Redis under the normalized question hash.
+
+        Args:
+            query: User's question
+
+        Returns:
+            Embedding vector
+        """
+        key = CacheService._hash_question(query)
+        embedding = self._embeddings.get(key)
+        if embedding is not None:
+            return embedding
+
+        embedding = await cache_service.get_cached_embedding(query)
+        if embedding is None:
+            embedding = (await asyncio.to_thread(self._embedding_fn, [query]))[0]
+            await cache_service.set_cached_embedding(query, embedding)
+
+        self._embeddings[key] = embedding
+        return embedding
+
     async def search(self, query: str, top_k: int = None) -> List[Tuple[str, str, float]]:
         """
         Search for relevant document chunks.
@@ -243,8 +412,10 @@ class RAGService:
         top_k = top_k or settings.top_k_results
 
         try:
-            results = self._collection.query(
-                query_texts=[query],
+            # The Chroma HTTP client is synchronous; keep it off the event loop
+            results = await asyncio.to_thread(
+                self._collection.query,
+                query_embeddings=[await self.embed_query(query)],
                 n_results=top_k,
             )
 
@@ -289,7 +460,19 @@ class RAGService:
             Formatted context string
         """
         results = await self.search(query, top_k)
-        
+        return self.format_context(results)
+
+    @staticmethod
+    def format_context(results: List[Tuple[str, str, float]]) -> str:
+        """
+        Format search results as LLM context.
+
+        Args:
+            results: Search results as returned by ``search``
+
+        Returns:
+            Formatted context string
+        """
         if not results:
             return ""
         
@@ -299,6 +482,108 @@ class RAGService:
         
         return "\n\n---\n\n".join(context_parts)
     
+    async def get_semantic_answer(self, query: str) -> Optional[dict]:
+        """
+        Look up a previously generated answer for a semantically similar question.
+
+        Questions are embedded into a separate cache collection; a stored
+        answer is reused when its cosine similarity to the query reaches
+        ``settings.semantic_cache_threshold``. Expired entries are pruned on read.
+
+        Args:
+            query: User's question
+
+        Returns:
+            Cached response dict (answer, sources, tokens_used) or None
+        """
+        if not settings.semantic_cache_enabled:
+            return None
+        if not self._available or self._query_cache is None:
+            return None
+
+        try:
+            results = await asyncio.to_thread(
+                self._query_cache.query,
+                query_embeddings=[await self.embed_query(query)],
+                n_results=1,
+                include=["metadatas", "distances"],
+            )
+
+            if not results["ids"] or not results["ids"][0]:
+                return None
+
+            entry_id = results["ids"][0][0]
+            metadata = results["metadatas"][0][0]
+            similarity = 1 - results["distances"][0][0]
+
+            if time.time() - metadata["ts"] > settings.semantic_cache_ttl:
+                await asyncio.to_thread(self._query_cache.delete, ids=[entry_id])
+                return None
+
+            if similarity < settings.semantic_cache_threshold:
+                return None
+
+            logger.info("Semantic cache hit", query=query[:50], similarity=round(similarity, 3))
+            return {
+                "answer": metadata["answer"],
+                "sources": orjson.loads(metadata["sources"]),
+                "tokens_used": metadata["tokens_used"],
+            }
+
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed", query=query[:50], error=str(e))
+            return None
+
+    async def cache_semantic_answer(
+        self,
+        query: str,
+        answer: str,
+        sources: List[dict],
+        tokens_used: int,
+    ) -> bool:
+        """
+        Store a generated answer in the semantic cache.
+
+        Args:
+            query: User's question
+            answer: Generated answer
+            sources: Serializable list of source dicts
+            tokens_used: Number of tokens used
+
+        Returns:
+            True if stored, False otherwise
+        """
+        if not settings.semantic_cache_enabled:
+            return False
+        if not self._available or self._query_cache is None:
+            return False
+
+        try:
+            await asyncio.to_thread(
+                self._query_cache.upsert,
+                documents=[query],
+                embeddings=[await self.embed_query(query)],
+                # Same normalization as the answer and embedding keys, so
+                # rephrasings that differ only in case/spacing share one entry
+                ids=[CacheService._hash_question(query).removeprefix("faq:")],
+                metadatas=[{
+                    "answer": answer,
+                    "sources": orjson.dumps(sources).decode(),
+                    "tokens_used": tokens_used,
+                    "ts": time.time(),
+                }],
+            )
+            return True
+        except Exception as e:
+            logger.warning("Failed to store semantic cache entry", query=query[:50], error=str(e))
+            return False
+
+    @staticmethod
+    async def _read_file(filepath: str) -> str:
+        """Read a UTF-8 text file without blocking the event loop."""
+        async with aiofiles.open(filepath, 'r', encoding='utf-8') as f:
+            return await f.read()
+
     async def load_documents_from_directory(self, directory: str) -> int:
         """
         Load all documents from a directory.
@@ -309,22 +594,34 @@ class RAGService:
         Returns:
             Total number of chunks created
         """
-        total_chunks = 0
-        
         if not os.path.exists(directory):
             logger.warning("Documents directory not found", directory=directory)
             return 0
         
-        for filename in os.listdir(directory):
-            if filename.endswith(('.txt', '.md')):
-                filepath = os.path.join(directory, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    chunks = await self.add_document(filename, content)
-                    total_chunks += chunks
-                except Exception as e:
-                    logger.error("Error loading document", filename=filename, error=str(e))
+        filenames = [
+            filename for filename in os.listdir(directory)
+            if filename.endswith(('.txt', '.md'))
+        ]
+
+        # Read all files concurrently so their disk latency overlaps
+        contents = await asyncio.gather(
+            *(self._read_file(os.path.join(directory, filename)) for filename in filenames),
+            return_exceptions=True,
+        )
+
+        documents: List[Tuple[str, str]] = []
+        for filename, content in zip(filenames, contents):
+            if isinstance(content, BaseException):
+                logger.error("Error loading document", filename=filename, error=str(content))
+            else:
+                documents.append((filename, content))
+
+        # Index the whole directory with one delete and batched adds
+        try:
+            total_chunks = await self.add_documents(documents)
+        except Exception as e:
+            logger.error("Error loading documents", directory=directory, error=str(e))
+            total_chunks = 0
         
         logger.info("Loaded documents from directory", directory=directory, total_chunks=total_chunks)
         return total_chunks
@@ -341,9 +638,10 @@ class RAGService:
         try:
             if not self._client:
                 await self.connect()
-            self._client.heartbeat()
+            await asyncio.to_thread(self._client.heartbeat)
             self._available = True
             self._reconnect_attempts = 0  # Reset on successful health check
+            self._circuit_open_until = 0.0
             return True
         except Exception as e:
             self._available = False
@@ -376,7 +674,7 @@ class RAGService:
                 }
 
         try:
-            count = self._collection.count()
+            count = await asyncio.to_thread(self._collection.count)
             return {
                 **base_stats,
                 "document_count": count,
@@ -397,8 +695,30 @@ class RAGService:
     def reset_reconnect_counter(self) -> None:
         """Reset the reconnection attempt counter to allow fresh reconnection attempts."""
         self._reconnect_attempts = 0
+        self._circuit_open_until = 0.0
         logger.info("Reconnect counter reset")
 
+    async def _monitor_connection(self) -> None:
+        """Probe ChromaDB outside the request path until the service is stopped."""
+        while True:
+            await asyncio.sleep(self.CIRCUIT_COOLDOWN)
+            if not self.is_available and await self.check_connection():
+                logger.info("ChromaDB connection restored by monitor")
+
+    def start_monitor(self) -> None:
+        """Start the background connection monitor."""
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.create_task(self._monitor_connection())
+
+    async def stop_monitor(self) -> None:
+        """Stop the background connection monitor."""
+        if self._monitor_task is None:
+            return
+        self._monitor_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._monitor_task
+        self._monitor_task = None
+
 
 # Global RAG service instance
 rag_service = RAGService()
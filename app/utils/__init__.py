@@ -3,6 +3,8 @@
 from app.utils.logging import setup_logging, get_logger
 from app.utils.metrics import (
     init_app_info,
+    render_metrics,
+    mark_worker_dead,
     record_request,
     record_cache_hit,
     record_cache_miss,
@@ -17,6 +19,8 @@ __all__ = [
     "setup_logging",
     "get_logger",
     "init_app_info",
+    "render_metrics",
+    "mark_worker_dead",
     "record_request",
     "record_cache_hit",
     "record_cache_miss",
@@ -1,11 +1,29 @@
-"""Prometheus metrics for the SmartTask FAQ service."""
-
-from prometheus_client import Counter, Histogram, Gauge, Info
+"""Prometheus metrics for the SmartTask FAQ service.
+
+With several uvicorn workers, set ``PROMETHEUS_MULTIPROC_DIR`` to an empty
+directory before start: every worker then writes its values there and
+``render_metrics`` aggregates them, instead of each scrape seeing only the
+worker that answered it.
+"""
+
+import os
+from typing import Dict, Tuple
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
 
-# Application info
-APP_INFO = Info(
-    "smarttask_faq_app",
-    "SmartTask FAQ application information"
+# Application info; a constant gauge rather than Info, which multiprocess
+# mode does not support. Exposed under the same sample name
+APP_INFO = Gauge(
+    "smarttask_faq_app_info",
+    "SmartTask FAQ application information",
+    ["version", "service"],
+    multiprocess_mode="max",
 )
 
 # Request metrics
@@ -62,7 +80,8 @@ RAG_SEARCH_COUNT = Counter(
 
 RAG_DOCUMENTS_INDEXED = Gauge(
     "smarttask_faq_rag_documents_indexed",
-    "Number of documents indexed in the vector store"
+    "Number of documents indexed in the vector store",
+    multiprocess_mode="livemostrecent",
 )
 
 # Document upload metrics
@@ -76,22 +95,59 @@ DOCUMENT_UPLOADS = Counter(
 SERVICE_UP = Gauge(
     "smarttask_faq_service_up",
     "Service availability (1 = up, 0 = down)",
-    ["service"]
+    ["service"],
+    multiprocess_mode="livemostrecent",
 )
 
+# Labelled children resolved once and reused, so hot-path emissions skip
+# the per-call label validation and lookup inside .labels()
+_CHILDREN: Dict[Tuple[object, Tuple[str, ...]], object] = {}
+
+RAG_SEARCH_SUCCESS = RAG_SEARCH_COUNT.labels(status="success")
+RAG_SEARCH_ERROR = RAG_SEARCH_COUNT.labels(status="error")
+DOCUMENT_UPLOAD_SUCCESS = DOCUMENT_UPLOADS.labels(status="success")
+DOCUMENT_UPLOAD_ERROR = DOCUMENT_UPLOADS.labels(status="error")
+
+
+def _child(metric, *labelvalues: str):
+    """Get the labelled child of a metric, binding it on first use."""
+    key = (metric, labelvalues)
+    child = _CHILDREN.get(key)
+    if child is None:
+        child = _CHILDREN[key] = metric.labels(*labelvalues)
+    return child
+
+
+def _multiprocess_dir() -> str:
+    """Directory shared by worker processes, or '' in single-process mode."""
+    return os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")
+
+
+def render_metrics() -> bytes:
+    """Render metrics in the Prometheus text format, across all workers if configured."""
+    if not _multiprocess_dir():
+        return generate_latest()
+    # A fresh registry per render; the collector reads the workers' files
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_worker_dead() -> None:
+    """Drop this worker's live gauges from the shared metrics on shutdown."""
+    if _multiprocess_dir():
+        multiprocess.mark_process_dead(os.getpid())
+
 
 def init_app_info(version: str = "1.0.0") -> None:
     """Initialize application info metric."""
-    APP_INFO.info({
-        "version": version,
-        "service": "smarttask-faq"
-    })
+    APP_INFO.labels(version=version, service="smarttask-faq").set(1)
 
 
 def record_request(method: str, endpoint: str, status: int, duration: float) -> None:
     """Record a request metric."""
-    REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=status).inc()
-    REQUEST_LATENCY.labels(method=method, endpoint=endpoint).observe(duration)
+    _child(REQUEST_COUNT, method, endpoint, str(status)).inc()
+    _child(REQUEST_LATENCY, method, endpoint).observe(duration)
 
 
 def record_cache_hit() -> None:
@@ -106,14 +162,14 @@ def record_cache_miss() -> None:
 
 def record_llm_usage(provider: str, tokens: int, duration: float, success: bool = True) -> None:
     """Record LLM usage metrics."""
-    LLM_TOKENS_USED.labels(provider=provider).inc(tokens)
-    LLM_REQUESTS.labels(provider=provider, status="success" if success else "error").inc()
-    LLM_LATENCY.labels(provider=provider).observe(duration)
+    _child(LLM_TOKENS_USED, provider).inc(tokens)
+    _child(LLM_REQUESTS, provider, "success" if success else "error").inc()
+    _child(LLM_LATENCY, provider).observe(duration)
 
 
 def record_rag_search(success: bool = True) -> None:
     """Record a RAG search."""
-    RAG_SEARCH_COUNT.labels(status="success" if success else "error").inc()
+    (RAG_SEARCH_SUCCESS if success else RAG_SEARCH_ERROR).inc()
 
 
 def update_documents_indexed(count: int) -> None:
@@ -123,9 +179,9 @@ def update_documents_indexed(count: int) -> None:
 
 def record_document_upload(success: bool = True) -> None:
     """Record a document upload."""
-    DOCUMENT_UPLOADS.labels(status="success" if success else "error").inc()
+    (DOCUMENT_UPLOAD_SUCCESS if success else DOCUMENT_UPLOAD_ERROR).inc()
 
 
 def update_service_health(service: str, is_up: bool) -> None:
     """Update service health status."""
-    SERVICE_UP.labels(service=service).set(1 if is_up else 0)
+    _child(SERVICE_UP, service).set(1 if is_up else 0)
@@ -0,0 +1,17 @@
+-- Migration: Replace the analytics btree index with BRIN
+-- Description: Date-range analytics over query_history use a BRIN index on
+-- created_at instead of the composite (created_at, tokens_used) btree
+--
+-- Run this migration on existing databases.
+-- For new deployments, the index is created automatically via SQLAlchemy.
+
+-- Rows are inserted in created_at order, so a BRIN index stays a few pages
+-- in size while still pruning most of the table for date-range scans
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_query_history_created_at_brin
+ON query_history USING brin (created_at) WITH (pages_per_range = 32);
+
+-- The composite btree is superseded by the BRIN index
+DROP INDEX CONCURRENTLY IF EXISTS ix_query_history_date_tokens;
+
+-- Analyze the table to update statistics after index changes
+ANALYZE query_history;
@@ -0,0 +1,12 @@
+-- Migration: Store query_history.sources as JSONB
+-- Description: Converts the sources column from JSON (text) to binary JSONB
+--
+-- Run this migration on existing databases.
+-- For new deployments, the column is created as JSONB via SQLAlchemy.
+
+-- Rewrites the table and takes an ACCESS EXCLUSIVE lock for the duration
+ALTER TABLE query_history
+ALTER COLUMN sources TYPE JSONB USING sources::jsonb;
+
+-- Analyze the table to update statistics after the rewrite
+ANALYZE query_history;
@@ -1,51 +1,78 @@
 """Pytest configuration and fixtures."""
 
+import httpx
 import pytest
+import pytest_asyncio
+from contextlib import ExitStack
 from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
 
+from app.config import get_settings
+from app.services.cache_service import CacheService
+from app.services.llm_service import LLMService
+from app.services.rag_service import RAGService
 
-@pytest.fixture
-def mock_services():
-    """Mock all external services for testing."""
-    with patch('app.services.cache_service.cache_service') as mock_cache, \
-         patch('app.services.rag_service.rag_service') as mock_rag, \
-         patch('app.services.llm_service.llm_service') as mock_llm, \
-         patch('app.db.database.check_db_connection') as mock_db_check:
-        
-        # Mock cache service
-        mock_cache.get_cached_answer = AsyncMock(return_value=None)
-        mock_cache.set_cached_answer = AsyncMock(return_value=True)
-        mock_cache.check_connection = AsyncMock(return_value=True)
-        
-        # Mock RAG service
-        mock_rag.search = AsyncMock(return_value=[
-            ("test_doc.txt", "Test chunk content", 0.9)
-        ])
-        mock_rag.get_context = AsyncMock(return_value="[Источник: test_doc.txt]\nTest chunk content")
-        mock_rag.add_document = AsyncMock(return_value=3)
-        mock_rag.check_connection = AsyncMock(return_value=True)
-        mock_rag.get_collection_stats = AsyncMock(return_value={"document_count": 10})
-        
-        # Mock LLM service
-        mock_llm.generate_answer = AsyncMock(return_value=(
+# Service mocks are built once; spec makes async methods AsyncMock children
+# without per-test instantiation
+_MOCK_CACHE = MagicMock(spec=CacheService)
+_MOCK_RAG = MagicMock(spec=RAGService)
+_MOCK_LLM = MagicMock(spec=LLMService)
+_MOCK_DB_CHECK = AsyncMock()
+
+
+def _configure_mock_services():
+    """Reset the service mocks and give them their default return values."""
+    for mock in (_MOCK_CACHE, _MOCK_RAG, _MOCK_LLM, _MOCK_DB_CHECK):
+        mock.reset_mock(return_value=True, side_effect=True)
+
+    _MOCK_CACHE.configure_mock(**{
+        "get_cached_answer.return_value": None,
+        "set_cached_answer.return_value": True,
+        "check_connection.return_value": True,
+    })
+    _MOCK_RAG.configure_mock(**{
+        "search.return_value": [("test_doc.txt", "Test chunk content", 0.9)],
+        "get_context.return_value": "[Источник: test_doc.txt]\nTest chunk content",
+        "add_document.return_value": 3,
+        "check_connection.return_value": True,
+        "get_collection_stats.return_value": {"document_count": 10},
+    })
+    _MOCK_LLM.configure_mock(**{
+        "generate_answer.return_value": (
             "SmartTask - это облачная платформа для управления проектами.",
             150,
-            500
-        ))
-        
-        # Mock DB check
-        mock_db_check.return_value = True
-        
+            500,
+        ),
+    })
+    _MOCK_DB_CHECK.return_value = True
+
+
+@pytest.fixture(scope="session")
+def mock_services():
+    """Mock all external services for testing.
+
+    The patches stay active for the whole session; ``_reset_mocks`` restores
+    the defaults before every test that uses them.
+    """
+    with ExitStack() as stack:
+        stack.enter_context(patch('app.services.cache_service.cache_service', _MOCK_CACHE))
+        stack.enter_context(patch('app.services.rag_service.rag_service', _MOCK_RAG))
+        stack.enter_context(patch('app.services.llm_service.llm_service', _MOCK_LLM))
+        stack.enter_context(patch('app.db.database.check_db_connection', _MOCK_DB_CHECK))
+        # The app lifespan must not open a connection to the real LLM API
+        stack.enter_context(patch.object(get_settings(), 'llm_warm_up', False))
+
+        _configure_mock_services()
+
         yield {
-            "cache": mock_cache,
-            "rag": mock_rag,
-            "llm": mock_llm,
-            "db_check": mock_db_check,
+            "cache": _MOCK_CACHE,
+            "rag": _MOCK_RAG,
+            "llm": _MOCK_LLM,
+            "db_check": _MOCK_DB_CHECK,
         }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def mock_db_session():
     """Mock database session."""
     session = AsyncMock()
@@ -56,15 +83,46 @@ def mock_db_session():
     return session
 
 
-@pytest.fixture
+def _make_db(session):
+    """Build a get_db replacement that yields the given session."""
+    async def get_mock_db():
+        yield session
+    return get_mock_db
+
+
+@pytest.fixture(autouse=True)
+def _reset_mocks(request):
+    """Give every test that uses the session mocks a clean set of calls and defaults."""
+    if "mock_services" in request.fixturenames:
+        request.getfixturevalue("mock_services")
+        _configure_mock_services()
+    if "mock_db_session" in request.fixturenames:
+        request.getfixturevalue("mock_db_session").reset_mock()
+
+
+@pytest.fixture(scope="session")
+def cache_service():
+    """CacheService shared by the cache tests; only ``_client`` changes between them."""
+    return CacheService()
+
+
+@pytest.fixture(autouse=True)
+def _reset_cache_client(request):
+    """Start every cache test without a Redis client."""
+    if "cache_service" in request.fixturenames:
+        request.getfixturevalue("cache_service")._client = None
+
+
+@pytest.fixture(scope="session")
 def test_client(mock_services, mock_db_session):
-    """Create a test client with mocked dependencies."""
+    """Create a test client with mocked dependencies.
+
+    Built once per session so the application lifespan runs only once.
+    """
     # Patch the database session
     with patch('app.api.routes.get_db') as mock_get_db:
-        async def get_mock_db():
-            yield mock_db_session
-        
-        mock_get_db.return_value = get_mock_db()
+        # A fresh generator per call; the old single generator was spent after one use
+        mock_get_db.side_effect = _make_db(mock_db_session)
         
         # Import app after patching
         from app.main import app
@@ -73,38 +131,54 @@ def test_client(mock_services, mock_db_session):
             yield client
 
 
-@pytest.fixture
+@pytest_asyncio.fixture
+async def async_client(mock_services):
+    """In-process async client: requests go straight to the ASGI app, no portal thread."""
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+_SAMPLE_DOCUMENTS = [
+    {
+        "filename": "overview.txt",
+        "content": """SmartTask Overview
+        
+        SmartTask is a cloud-based project management platform.
+        It helps teams plan, track, and complete projects faster.
+        
+        Key features include:
+        - Task boards (Kanban, Gantt)
+        - Time management and deadlines
+        - Collaboration and comments
+        - Integrations (Slack, Google Drive, GitHub)
+        - Progress and performance reports
+        """
+    },
+    {
+        "filename": "pricing.txt",
+        "content": """SmartTask Pricing
+        
+        1. Free - up to 5 users, basic features
+        2. Pro - $9/user/month, advanced reports and integrations
+        3. Enterprise - custom pricing, SLA support and SSO
+        """
+    }
+]
+# Encoded once at import for upload-style tests
+for _doc in _SAMPLE_DOCUMENTS:
+    _doc["content_bytes"] = _doc["content"].encode()
+
+
+@pytest.fixture(scope="session")
 def sample_documents():
     """Sample documents for testing."""
-    return [
-        {
-            "filename": "overview.txt",
-            "content": """SmartTask Overview
-            
-            SmartTask is a cloud-based project management platform.
-            It helps teams plan, track, and complete projects faster.
-            
-            Key features include:
-            - Task boards (Kanban, Gantt)
-            - Time management and deadlines
-            - Collaboration and comments
-            - Integrations (Slack, Google Drive, GitHub)
-            - Progress and performance reports
-            """
-        },
-        {
-            "filename": "pricing.txt",
-            "content": """SmartTask Pricing
-            
-            1. Free - up to 5 users, basic features
-            2. Pro - $9/user/month, advanced reports and integrations
-            3. Enterprise - custom pricing, SLA support and SSO
-            """
-        }
-    ]
+    return _SAMPLE_DOCUMENTS
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_questions():
     """Sample questions for testing."""
     return [
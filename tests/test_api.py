@@ -1,29 +1,41 @@
 """Unit tests for API endpoints."""
 
+import json
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
 from fastapi.testclient import TestClient
 
+# Fields of a successful /api/ask response and their JSON types
+ASK_RESPONSE_TYPES = {
+    "answer": str,
+    "sources": list,
+    "tokens_used": int,
+    "response_time_ms": int,
+    "cached": bool,
+}
+
+TEST_UPLOAD = b"Test document content for SmartTask FAQ."
+
 
 class TestAskEndpoint:
     """Tests for /api/ask endpoint."""
     
     @pytest.mark.asyncio
-    async def test_ask_empty_question_returns_error(self, test_client):
+    async def test_ask_empty_question_returns_error(self, async_client):
         """Test that empty question returns validation error."""
-        response = test_client.post("/api/ask", json={"question": ""})
+        response = await async_client.post("/api/ask", json={"question": ""})
         assert response.status_code == 422
     
     @pytest.mark.asyncio
-    async def test_ask_missing_question_returns_error(self, test_client):
+    async def test_ask_missing_question_returns_error(self, async_client):
         """Test that missing question field returns validation error."""
-        response = test_client.post("/api/ask", json={})
+        response = await async_client.post("/api/ask", json={})
         assert response.status_code == 422
     
     @pytest.mark.asyncio
-    async def test_ask_valid_question_structure(self, test_client, mock_services):
+    async def test_ask_valid_question_structure(self, async_client, mock_services):
         """Test that valid question returns proper response structure."""
-        response = test_client.post(
+        response = await async_client.post(
             "/api/ask", 
             json={"question": "Что такое SmartTask?"}
         )
@@ -31,19 +43,9 @@ class TestAskEndpoint:
         assert response.status_code == 200
         data = response.json()
         
-        # Check response structure
-        assert "answer" in data
-        assert "sources" in data
-        assert "tokens_used" in data
-        assert "response_time_ms" in data
-        assert "cached" in data
-        
-        # Check types
-        assert isinstance(data["answer"], str)
-        assert isinstance(data["sources"], list)
-        assert isinstance(data["tokens_used"], int)
-        assert isinstance(data["response_time_ms"], int)
-        assert isinstance(data["cached"], bool)
+        # Check response structure and types in one comparison
+        assert data.keys() >= ASK_RESPONSE_TYPES.keys()
+        assert {key: type(data[key]) for key in ASK_RESPONSE_TYPES} == ASK_RESPONSE_TYPES
 
 
 class TestHealthEndpoint:
@@ -78,11 +80,9 @@ class TestDocumentsEndpoint:
     @pytest.mark.asyncio
     async def test_upload_valid_file(self, test_client, mock_services):
         """Test that uploading valid file succeeds."""
-        content = "Test document content for SmartTask FAQ."
-        
         response = test_client.post(
             "/api/documents",
-            files={"file": ("test.txt", content.encode(), "text/plain")}
+            files={"file": ("test.txt", TEST_UPLOAD, "text/plain")}
         )
         
         assert response.status_code == 200
@@ -91,3 +91,221 @@ class TestDocumentsEndpoint:
         assert data["filename"] == "test.txt"
         assert "chunks_created" in data
         assert isinstance(data["chunks_created"], int)
+
+
+class TestSanitizeFilename:
+    """Tests for upload filename sanitization."""
+
+    def test_safe_filename_is_unchanged(self):
+        """Test that a filename with only allowed characters is returned as is."""
+        from app.api.routes import sanitize_filename
+
+        assert sanitize_filename("user manual-v2.txt") == "user manual-v2.txt"
+
+    def test_path_components_are_removed(self):
+        """Test that directory traversal components are stripped."""
+        from app.api.routes import sanitize_filename
+
+        assert sanitize_filename("../../etc/passwd.txt") == "passwd.txt"
+
+    def test_unsafe_characters_are_replaced(self):
+        """Test that unsafe characters are replaced and the extension kept."""
+        from app.api.routes import sanitize_filename
+
+        assert sanitize_filename("doc;rm -rf.md") == "doc_rm_-rf.md"
+
+    def test_non_ascii_filename_is_unchanged(self):
+        """Test that non-ASCII word characters bypass the fast path but are kept."""
+        from app.api.routes import sanitize_filename
+
+        assert sanitize_filename("инструкция.md") == "инструкция.md"
+
+
+class TestAskStreamEndpoint:
+    """Tests for /api/ask/stream endpoint."""
+
+    @pytest.fixture
+    def stream_client(self, test_client):
+        """Shared client with the services used by /ask/stream patched in the routes module."""
+        async def answer_stream(question, context, usage=None):
+            usage.tokens_used = 12
+            for part in ("Smart", "Task"):
+                yield part
+
+        with patch("app.api.routes.cache_service") as mock_cache, \
+             patch("app.api.routes.rag_service") as mock_rag, \
+             patch("app.api.routes.llm_service") as mock_llm, \
+             patch("app.api.routes.schedule_history_write") as mock_history:
+            mock_cache.get_cached_answer = AsyncMock(return_value=None)
+            mock_cache.set_cached_answer = AsyncMock(return_value=True)
+            mock_rag.get_semantic_answer = AsyncMock(return_value=None)
+            mock_rag.cache_semantic_answer = AsyncMock(return_value=True)
+            mock_rag.search = AsyncMock(return_value=[("doc.txt", "chunk", 0.9)])
+            mock_rag.format_context.return_value = "[Источник: doc.txt]\nchunk"
+            mock_llm.generate_answer_stream = answer_stream
+
+            yield test_client, mock_cache, mock_history
+
+    def test_stream_returns_answer_text(self, stream_client):
+        """Test that chunks are streamed and the full answer is cached."""
+        client, mock_cache, mock_history = stream_client
+
+        response = client.post("/api/ask/stream", json={"question": "Что такое SmartTask?"})
+
+        assert response.status_code == 200
+        assert response.text == "SmartTask"
+        assert response.headers["x-cached"] == "false"
+        assert json.loads(response.headers["x-sources"]) == [
+            {"document": "doc.txt", "chunk": "chunk"},
+        ]
+        cached = mock_cache.set_cached_answer.call_args.args[1]
+        assert cached["answer"] == "SmartTask"
+        assert cached["tokens_used"] == 12
+        mock_history.assert_called_once()
+
+    def test_stream_serves_cached_answer(self, stream_client):
+        """Test that a cached answer is returned without calling the LLM."""
+        client, mock_cache, mock_history = stream_client
+        sources = [{"document": "тарифы.txt", "chunk": "Pro стоит $9"}]
+        mock_cache.get_cached_answer.return_value = {
+            "answer": "Cached", "sources": sources, "tokens_used": 1,
+        }
+
+        response = client.post("/api/ask/stream", json={"question": "Что такое SmartTask?"})
+
+        assert response.text == "Cached"
+        assert response.headers["x-cached"] == "true"
+        assert json.loads(response.headers["x-sources"]) == sources
+        mock_history.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_provider_stream_is_closed_when_body_stops_early(self):
+        """Test that the LLM stream is closed if the client stops reading."""
+        from app.api.routes import ask_question_stream
+        from app.models import AskRequest
+
+        closed = []
+
+        async def answer_stream(question, context, usage=None):
+            try:
+                for part in ("Smart", "Task"):
+                    yield part
+            finally:
+                closed.append(True)
+
+        with patch("app.api.routes.cache_service") as mock_cache, \
+             patch("app.api.routes.rag_service") as mock_rag, \
+             patch("app.api.routes.llm_service") as mock_llm:
+            mock_cache.get_cached_answer = AsyncMock(return_value=None)
+            mock_rag.get_semantic_answer = AsyncMock(return_value=None)
+            mock_rag.search = AsyncMock(return_value=[])
+            mock_rag.format_context.return_value = ""
+            mock_llm.generate_answer_stream = answer_stream
+
+            response = await ask_question_stream(AskRequest(question="Вопрос"))
+            body = response.body_iterator
+            assert await anext(body) == "Smart"
+            await body.aclose()
+
+        assert closed == [True]
+
+    @pytest.mark.asyncio
+    async def test_provider_stream_is_closed_when_client_leaves_before_body(self):
+        """Test that the LLM stream is closed if the body is never iterated."""
+        import asyncio
+        from app.api.routes import ask_question_stream
+        from app.models import AskRequest
+
+        closed = []
+
+        async def answer_stream(question, context, usage=None):
+            try:
+                for part in ("Smart", "Task"):
+                    yield part
+            finally:
+                closed.append(True)
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            # The client is gone before the response starts
+            await asyncio.Event().wait()
+
+        with patch("app.api.routes.cache_service") as mock_cache, \
+             patch("app.api.routes.rag_service") as mock_rag, \
+             patch("app.api.routes.llm_service") as mock_llm:
+            mock_cache.get_cached_answer = AsyncMock(return_value=None)
+            mock_rag.get_semantic_answer = AsyncMock(return_value=None)
+            mock_rag.search = AsyncMock(return_value=[])
+            mock_rag.format_context.return_value = ""
+            mock_llm.generate_answer_stream = answer_stream
+
+            response = await ask_question_stream(AskRequest(question="Вопрос"))
+            await response({"type": "http"}, receive, send)
+
+        assert closed == [True]
+
+
+class TestStoreAnswer:
+    """Tests for writing a generated answer to the caches and history."""
+
+    @pytest.mark.asyncio
+    async def test_semantic_cache_write_runs_in_background(self):
+        """Test that the response does not wait for the ChromaDB upsert."""
+        import asyncio
+        from app.api.routes import _store_answer, wait_for_pending_writes
+
+        release = asyncio.Event()
+
+        async def slow_upsert(*args):
+            await release.wait()
+            return True
+
+        with patch("app.api.routes.cache_service") as mock_cache, \
+             patch("app.api.routes.rag_service") as mock_rag, \
+             patch("app.api.routes.schedule_history_write"):
+            mock_cache.set_cached_answer = AsyncMock(return_value=True)
+            mock_rag.cache_semantic_answer = AsyncMock(side_effect=slow_upsert)
+
+            await asyncio.wait_for(_store_answer("Вопрос", "Ответ", [], 5, 100), timeout=1)
+
+            mock_rag.cache_semantic_answer.assert_awaited_once_with("Вопрос", "Ответ", [], 5)
+            release.set()
+            await wait_for_pending_writes()
+
+
+class TestLookupCachedAnswer:
+    """Tests for the exact/semantic cache lookup used by /ask."""
+
+    @pytest.mark.asyncio
+    async def test_semantic_hit_is_copied_to_exact_cache(self):
+        """Test that a paraphrase hit is stored under the question's own key."""
+        from app.api.routes import _lookup_cached_answer
+
+        hit = {"answer": "Pro стоит $9", "sources": [], "tokens_used": 5}
+        with patch("app.api.routes.cache_service") as mock_cache, \
+             patch("app.api.routes.rag_service") as mock_rag:
+            mock_cache.get_cached_answer = AsyncMock(return_value=None)
+            mock_cache.set_cached_answer = AsyncMock(return_value=True)
+            mock_rag.get_semantic_answer = AsyncMock(return_value=hit)
+
+            result = await _lookup_cached_answer("Какая цена Pro?")
+
+        assert result == hit
+        mock_cache.set_cached_answer.assert_awaited_once_with("Какая цена Pro?", hit)
+
+    @pytest.mark.asyncio
+    async def test_exact_hit_skips_semantic_cache(self):
+        """Test that an exact Redis hit does not query the semantic cache."""
+        from app.api.routes import _lookup_cached_answer
+
+        hit = {"answer": "Cached", "sources": [], "tokens_used": 1}
+        with patch("app.api.routes.cache_service") as mock_cache, \
+             patch("app.api.routes.rag_service") as mock_rag:
+            mock_cache.get_cached_answer = AsyncMock(return_value=hit)
+            mock_rag.get_semantic_answer = AsyncMock()
+
+            assert await _lookup_cached_answer("Вопрос") == hit
+
+        mock_rag.get_semantic_answer.assert_not_called()
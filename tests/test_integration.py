@@ -1,14 +1,26 @@
 """Integration tests for the FAQ API."""
 
-import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 
+PRICING_DOCUMENT = b"""
+SmartTask Pricing Guide
+
+SmartTask offers three pricing tiers:
+1. Free Plan: Up to 5 users, basic features included.
+2. Pro Plan: $9 per user per month, includes advanced reporting.
+3. Enterprise Plan: Custom pricing with SLA support.
+
+All plans include unlimited projects and tasks.
+"""
+
+# Exceeds the 1000-character question limit
+LONG_QUESTION = "Что такое SmartTask? " * 100
+
 
 class TestFAQIntegration:
     """Integration tests for the complete FAQ flow."""
     
-    @pytest.mark.asyncio
-    async def test_full_faq_flow(self, test_client, mock_services):
+    def test_full_faq_flow(self, test_client, mock_services):
         """
         Test the complete FAQ flow:
         1. Upload a document
@@ -16,20 +28,9 @@ class TestFAQIntegration:
         3. Verify answer contains relevant information
         """
         # Step 1: Upload a document
-        doc_content = """
-        SmartTask Pricing Guide
-        
-        SmartTask offers three pricing tiers:
-        1. Free Plan: Up to 5 users, basic features included.
-        2. Pro Plan: $9 per user per month, includes advanced reporting.
-        3. Enterprise Plan: Custom pricing with SLA support.
-        
-        All plans include unlimited projects and tasks.
-        """
-        
         upload_response = test_client.post(
             "/api/documents",
-            files={"file": ("pricing.txt", doc_content.encode(), "text/plain")}
+            files={"file": ("pricing.txt", PRICING_DOCUMENT, "text/plain")}
         )
         
         assert upload_response.status_code == 200
@@ -49,8 +50,7 @@ class TestFAQIntegration:
         assert data["tokens_used"] > 0
         assert data["response_time_ms"] > 0
     
-    @pytest.mark.asyncio
-    async def test_cache_workflow(self, test_client, mock_services):
+    def test_cache_workflow(self, test_client, mock_services):
         """
         Test caching workflow:
         1. Ask a question (cache miss)
@@ -72,8 +72,7 @@ class TestFAQIntegration:
         # the second request would have cached=True.
         # Here we just verify the structure is correct.
     
-    @pytest.mark.asyncio
-    async def test_error_handling(self, test_client):
+    def test_error_handling(self, test_client):
         """Test that errors are handled gracefully."""
         # Test with invalid JSON
         response = test_client.post(
@@ -84,8 +83,7 @@ class TestFAQIntegration:
         
         assert response.status_code == 422
     
-    @pytest.mark.asyncio
-    async def test_health_check_integration(self, test_client):
+    def test_health_check_integration(self, test_client):
         """Test health check reflects service status."""
         response = test_client.get("/api/health")
         
@@ -98,8 +96,7 @@ class TestFAQIntegration:
         assert data["redis"] in ["healthy", "unhealthy"]
         assert data["chromadb"] in ["healthy", "unhealthy"]
     
-    @pytest.mark.asyncio
-    async def test_stats_endpoint(self, test_client, mock_services):
+    def test_stats_endpoint(self, test_client, mock_services):
         """Test statistics endpoint."""
         response = test_client.get("/api/stats")
         
@@ -117,11 +114,9 @@ class TestAPIEdgeCases:
     
     def test_very_long_question(self, test_client):
         """Test handling of very long questions."""
-        long_question = "Что такое SmartTask? " * 100  # Very long question
-        
         response = test_client.post(
             "/api/ask",
-            json={"question": long_question}
+            json={"question": LONG_QUESTION}
         )
         
         # Should either succeed or return validation error, not crash
@@ -0,0 +1,306 @@
+"""Unit tests for llm_service.
+
+Tests cover:
+- Exact-match answer caching
+- Running providers without blocking the event loop
+- Coalescing concurrent identical calls
+- Connection lifecycle
+- Streaming answers
+"""
+
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from app.config import get_settings
+from app.services.llm_service import LLMProvider, LLMService, StreamUsage
+
+
+class FakeProvider(LLMProvider):
+    """Provider that counts calls and echoes the prompt size."""
+
+    def __init__(self):
+        self.calls = 0
+        self.thread_id = None
+        self.closed = False
+
+    @property
+    def name(self) -> str:
+        return "fake"
+
+    @property
+    def default_model(self) -> str:
+        return "fake-model"
+
+    def generate(
+        self,
+        user_message: str,
+        system_prompt: str,
+        max_tokens: int = 1024,
+        model: str | None = None,
+    ) -> tuple[str, int]:
+        self.calls += 1
+        self.thread_id = threading.get_ident()
+        return f"answer {self.calls}", len(user_message)
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+    def is_configured(self) -> bool:
+        return True
+
+
+@pytest.fixture
+def provider():
+    """Create a fresh fake provider."""
+    return FakeProvider()
+
+
+@pytest.fixture
+def service(provider):
+    """Create an LLMService using the fake provider."""
+    with patch.object(get_settings(), "anthropic_api_key", "test-key"):
+        service = LLMService(provider_name="anthropic")
+    service.register_provider(provider)
+    service.set_provider("fake")
+    return service
+
+
+class TestLLMServiceCache:
+    """Tests for the exact-match answer cache."""
+
+    @pytest.mark.asyncio
+    async def test_repeat_question_is_served_from_cache(self, service, provider):
+        """The same question and context should call the provider only once."""
+        first = await service.generate_answer("Что такое SmartTask?", "context")
+        second = await service.generate_answer("Что такое SmartTask?", "context")
+
+        assert provider.calls == 1
+        assert second[:2] == first[:2]
+        assert second[2] == 0
+
+    @pytest.mark.asyncio
+    async def test_different_context_misses_cache(self, service, provider):
+        """A change in the RAG context should produce a new provider call."""
+        await service.generate_answer("Что такое SmartTask?", "context A")
+        await service.generate_answer("Что такое SmartTask?", "context B")
+
+        assert provider.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_system_prompt_change_misses_cache(self, service, provider):
+        """Changing the system prompt should invalidate cached answers."""
+        await service.generate_answer("Вопрос", "context")
+        service.system_prompt = "Другой промпт"
+        await service.generate_answer("Вопрос", "context")
+
+        assert provider.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_clear_cache(self, service, provider):
+        """clear_cache should force the next call to reach the provider."""
+        await service.generate_answer("Вопрос", "context")
+        service.clear_cache()
+        await service.generate_answer("Вопрос", "context")
+
+        assert provider.calls == 2
+
+
+class AsyncFakeProvider(FakeProvider):
+    """Provider with a native async implementation."""
+
+    @property
+    def name(self) -> str:
+        return "async-fake"
+
+    async def agenerate(
+        self,
+        user_message: str,
+        system_prompt: str,
+        max_tokens: int = 1024,
+        model: str | None = None,
+    ) -> tuple[str, int]:
+        self.calls += 1
+        return "async answer", 7
+
+
+class TestLLMServiceConcurrency:
+    """Tests for non-blocking provider calls."""
+
+    @pytest.mark.asyncio
+    async def test_sync_provider_runs_in_worker_thread(self, service, provider):
+        """A provider with only a blocking generate should run off the event loop."""
+        await service.generate_answer("Вопрос", "context")
+
+        assert provider.thread_id is not None
+        assert provider.thread_id != threading.get_ident()
+
+    @pytest.mark.asyncio
+    async def test_async_provider_is_awaited(self, service):
+        """A provider overriding agenerate should be awaited directly."""
+        async_provider = AsyncFakeProvider()
+        service.register_provider(async_provider)
+        service.set_provider("async-fake")
+
+        answer, tokens, _ = await service.generate_answer("Вопрос", "context")
+
+        assert (answer, tokens) == ("async answer", 7)
+        assert async_provider.calls == 1
+        assert async_provider.thread_id is None
+
+
+class SlowAsyncProvider(AsyncFakeProvider):
+    """Async provider that yields to the event loop before answering."""
+
+    @property
+    def name(self) -> str:
+        return "slow-fake"
+
+    async def agenerate(self, *args, **kwargs) -> tuple[str, int]:
+        await asyncio.sleep(0.01)
+        return await super().agenerate(*args, **kwargs)
+
+
+class TestLLMServiceSingleFlight:
+    """Tests for coalescing concurrent identical calls."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_calls_share_one_provider_call(self, service):
+        """Callers asking the same question at once should wait for one provider call."""
+        slow = SlowAsyncProvider()
+        service.register_provider(slow)
+        service.set_provider("slow-fake")
+
+        results = await asyncio.gather(
+            *(service.generate_answer("Вопрос", "context") for _ in range(5))
+        )
+
+        assert slow.calls == 1
+        assert {(answer, tokens) for answer, tokens, _ in results} == {("async answer", 7)}
+        assert service._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_different_questions_are_not_coalesced(self, service):
+        """Concurrent calls with different prompts should each reach the provider."""
+        slow = SlowAsyncProvider()
+        service.register_provider(slow)
+        service.set_provider("slow-fake")
+
+        await asyncio.gather(
+            service.generate_answer("Вопрос 1", "context"),
+            service.generate_answer("Вопрос 2", "context"),
+        )
+
+        assert slow.calls == 2
+
+
+class TestLLMServiceLifecycle:
+    """Tests for warm-up and shutdown."""
+
+    @pytest.mark.asyncio
+    async def test_close_releases_all_providers(self, service, provider):
+        """close should release every registered provider, not just the active one."""
+        other = AsyncFakeProvider()
+        service.register_provider(other)
+
+        await service.close()
+
+        assert provider.closed
+        assert other.closed
+
+    @pytest.mark.asyncio
+    async def test_close_failure_does_not_skip_other_providers(self, service, provider):
+        """A provider that fails to close must not keep the others open."""
+
+        class FailingProvider(AsyncFakeProvider):
+            @property
+            def name(self) -> str:
+                return "failing"
+
+            async def aclose(self) -> None:
+                raise RuntimeError("Event loop is closed")
+
+        service.register_provider(FailingProvider())
+        service.register_provider(AsyncFakeProvider())
+
+        await service.close()
+
+        assert provider.closed
+        assert service._registry.get("async-fake").closed
+
+    @pytest.mark.asyncio
+    async def test_warm_up_failure_is_ignored(self, service, provider):
+        """A failed warm-up must not prevent startup."""
+
+        async def fail():
+            raise ConnectionError("unreachable")
+
+        provider.warm_up = fail
+
+        await service.warm_up()
+
+
+class TestAvailableProviders:
+    """Tests for the configured-provider list."""
+
+    def test_available_list_is_cached_until_register(self, service):
+        """is_configured should run once per registration, not on every call."""
+        checks = []
+
+        class CountingProvider(FakeProvider):
+            @property
+            def name(self) -> str:
+                return "counting"
+
+            def is_configured(self) -> bool:
+                checks.append(1)
+                return True
+
+        service.register_provider(CountingProvider())
+
+        assert "counting" in service.get_available_providers()
+        assert "counting" in service.get_available_providers()
+        assert len(checks) == 1
+
+        service.register_provider(AsyncFakeProvider())
+
+        assert "async-fake" in service.get_available_providers()
+        assert len(checks) == 2
+
+
+class TestCountTokens:
+    """Tests for token counting."""
+
+    def test_special_tokens_are_counted_as_text(self, service):
+        """Text containing special-token markers should not raise."""
+        assert service.count_tokens("Hello <|endoftext|>") > 0
+
+    def test_empty_text(self, service):
+        """Empty text has no tokens."""
+        assert service.count_tokens("") == 0
+
+
+class TestLLMServiceStream:
+    """Tests for streamed answers."""
+
+    @pytest.mark.asyncio
+    async def test_default_stream_yields_full_answer(self, service, provider):
+        """Providers without a streaming API yield their answer as one chunk."""
+        usage = StreamUsage()
+
+        chunks = [c async for c in service.generate_answer_stream("Вопрос", "context", usage)]
+
+        assert chunks == ["answer 1"]
+        assert usage.tokens_used > 0
+
+    @pytest.mark.asyncio
+    async def test_streamed_answer_is_cached(self, service, provider):
+        """A completed stream should populate the answer cache."""
+        [c async for c in service.generate_answer_stream("Вопрос", "context")]
+        answer, tokens, response_time = await service.generate_answer("Вопрос", "context")
+
+        assert provider.calls == 1
+        assert answer == "answer 1"
+        assert response_time == 0
@@ -0,0 +1,34 @@
+"""Unit tests for Prometheus metrics rendering."""
+
+import os
+import subprocess
+import sys
+
+from app.utils.metrics import init_app_info, render_metrics
+
+# Records one cache hit in a fresh process, as a uvicorn worker would
+RECORD_HIT = "from app.utils.metrics import record_cache_hit; record_cache_hit()"
+
+
+class TestRenderMetrics:
+    """Tests for single- and multi-process metrics output."""
+
+    def test_single_process_renders_local_registry(self, monkeypatch):
+        """Without a multiprocess directory the process's own metrics are rendered."""
+        monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+        init_app_info(version="test")
+
+        body = render_metrics().decode()
+
+        assert 'smarttask_faq_app_info{service="smarttask-faq",version="test"} 1.0' in body
+
+    def test_worker_counters_are_aggregated(self, tmp_path, monkeypatch):
+        """Counters written by separate worker processes are summed in one scrape."""
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", RECORD_HIT], env=env, check=True)
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+        body = render_metrics().decode()
+
+        assert "smarttask_faq_cache_hits_total 2.0" in body
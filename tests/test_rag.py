@@ -1,16 +1,23 @@
 """Unit tests for RAG service."""
 
+import threading
+import time
+
+import numpy as np
+import orjson
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 
+from app.config import get_settings
+from app.services.cache_service import CacheService
+from app.services.rag_service import RAGService
+
 
 class TestRAGService:
     """Tests for RAG service functionality."""
     
     def test_chunk_text_basic(self):
         """Test basic text chunking."""
-        from app.services.rag_service import RAGService
-        
         service = RAGService()
         text = "This is a test. " * 100  # ~1600 characters
         
@@ -21,8 +28,6 @@ class TestRAGService:
     
     def test_chunk_text_empty(self):
         """Test chunking empty text."""
-        from app.services.rag_service import RAGService
-        
         service = RAGService()
         chunks = service._chunk_text("")
         
@@ -30,8 +35,6 @@ class TestRAGService:
     
     def test_chunk_text_small(self):
         """Test chunking text smaller than chunk size."""
-        from app.services.rag_service import RAGService
-        
         service = RAGService()
         text = "Short text."
         
@@ -42,8 +45,6 @@ class TestRAGService:
     
     def test_chunk_text_preserves_sentence_boundaries(self):
         """Test that chunking tries to preserve sentence boundaries."""
-        from app.services.rag_service import RAGService
-        
         service = RAGService()
         text = "First sentence. Second sentence. Third sentence. Fourth sentence."
         
@@ -55,11 +56,46 @@ class TestRAGService:
             if len(stripped) > 20:  # Only check if chunk is substantial
                 assert stripped.endswith('.') or stripped.endswith('\n')
     
+    def test_chunk_text_breaks_after_questions(self):
+        """Test that question and exclamation marks count as sentence boundaries."""
+        service = RAGService()
+        text = "Как создать проект? Нажмите кнопку! Проект появится в списке"
+        
+        chunks = service._chunk_text(text, chunk_size=45, overlap=5)
+        
+        assert chunks[0] == "Как создать проект? Нажмите кнопку!"
+
+    def test_chunk_text_has_no_overlap_only_tail(self):
+        """Test that chunking stops once a chunk reaches the end of the text."""
+        service = RAGService()
+        text = "a" * 100
+
+        chunks = service._chunk_text(text, chunk_size=60, overlap=10, min_chars=0)
+
+        assert chunks == ["a" * 60, "a" * 50]
+
+    def test_chunk_text_drops_tiny_duplicate_fragments(self):
+        """Test that a short chunk already contained in the previous one is not indexed."""
+        service = RAGService()
+        text = "a" * 100
+
+        chunks = service._chunk_text(text, chunk_size=60, overlap=10, min_chars=55)
+
+        assert chunks == ["a" * 60]
+
+    def test_chunk_text_keeps_short_tail(self):
+        """Test that a short last chunk with new text survives a small overlap."""
+        service = RAGService()
+        text = "Нажмите кнопку «Создать проект» в верхнем меню. tail words here end"
+
+        chunks = service._chunk_text(text, chunk_size=50, overlap=10, min_chars=32)
+
+        assert chunks[-1].endswith("tail words here end")
+        assert len(chunks[-1]) < 32
+
     @pytest.mark.asyncio
     async def test_search_returns_results(self):
         """Test that search returns properly formatted results."""
-        from app.services.rag_service import RAGService
-        
         service = RAGService()
         
         # Mock the ChromaDB collection
@@ -83,8 +119,6 @@ class TestRAGService:
     @pytest.mark.asyncio
     async def test_get_context_formats_correctly(self):
         """Test that context is properly formatted."""
-        from app.services.rag_service import RAGService
-        
         service = RAGService()
         
         # Mock search to return results
@@ -104,15 +138,286 @@ class TestRAGService:
         assert "Chunk content here" in context
         assert "[Источник:" in context
 
+    def test_format_context(self):
+        """Test that search results are joined with source headers."""
+        context = RAGService.format_context([
+            ("a.txt", "First chunk", 0.9),
+            ("b.txt", "Second chunk", 0.8),
+        ])
+
+        assert context == "[Источник: a.txt]\nFirst chunk\n\n---\n\n[Источник: b.txt]\nSecond chunk"
+        assert RAGService.format_context([]) == ""
+
+    @pytest.mark.asyncio
+    async def test_load_directory_indexes_in_one_batch(self, tmp_path):
+        """Test that a directory is indexed with one upsert and one stale-chunk delete."""
+        (tmp_path / "a.txt").write_text("First document.", encoding="utf-8")
+        (tmp_path / "b.md").write_text("Second document.", encoding="utf-8")
+        (tmp_path / "skip.pdf").write_text("Ignored.", encoding="utf-8")
+
+        service = RAGService()
+        service._client = MagicMock()
+        service._client.get_max_batch_size.return_value = 1000
+        service._collection = MagicMock()
+        service._available = True
+
+        total = await service.load_documents_from_directory(str(tmp_path))
+
+        assert total == 2
+        service._collection.upsert.assert_called_once()
+        assert sorted(service._collection.upsert.call_args.kwargs["ids"]) == ["a.txt_0", "b.md_0"]
+        service._collection.delete.assert_called_once()
+        where = service._collection.delete.call_args.kwargs["where"]
+        assert sorted(f["$and"][0]["source"] for f in where["$or"]) == ["a.txt", "b.md"]
+        service._collection.add.assert_not_called()
+        service._collection.get.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_add_documents_builds_metadata_per_batch(self):
+        """Test that ids and metadata stay aligned with chunks across upsert batches."""
+        service = RAGService()
+        service._client = MagicMock()
+        service._client.get_max_batch_size.return_value = 2
+        service._collection = MagicMock()
+        service._available = True
+
+        with patch.object(service, "_chunk_text", side_effect=[["a0", "a1"], ["b0"]]):
+            total = await service.add_documents([("a.txt", "..."), ("b.txt", "...")])
+
+        assert total == 3
+        calls = [c.kwargs for c in service._collection.upsert.call_args_list]
+        assert [c["ids"] for c in calls] == [["a.txt_0", "a.txt_1"], ["b.txt_0"]]
+        assert calls[1]["documents"] == ["b0"]
+        assert calls[1]["metadatas"] == [{"source": "b.txt", "chunk_index": 0}]
+
+    @pytest.mark.asyncio
+    async def test_add_document_upserts_all_chunks_in_one_call(self):
+        """Test that a multi-chunk upload reaches Chroma in a single upsert."""
+        service = RAGService()
+        service._client = MagicMock()
+        service._client.get_max_batch_size.return_value = 1000
+        service._collection = MagicMock()
+        service._available = True
+
+        total = await service.add_document("guide.txt", "Sentence number one. " * 100)
+
+        assert total > 1
+        service._collection.upsert.assert_called_once()
+        assert len(service._collection.upsert.call_args.kwargs["documents"]) == total
+
+    @pytest.mark.asyncio
+    async def test_add_document_drops_only_stale_chunks(self):
+        """Test that re-adding a document deletes only chunks past its new length."""
+        service = RAGService()
+        service._client = MagicMock()
+        service._client.get_max_batch_size.return_value = 1000
+        service._collection = MagicMock()
+        service._available = True
+
+        await service.add_document("doc.txt", "Only sentence.")
+
+        service._collection.delete.assert_called_once_with(
+            where={"$and": [{"source": "doc.txt"}, {"chunk_index": {"$gte": 1}}]}
+        )
+
+    @pytest.mark.asyncio
+    async def test_connect_configures_hnsw_index(self):
+        """Test that both collections are created with the tuned cosine HNSW index."""
+        service = RAGService()
+        with patch("app.services.rag_service.chromadb.HttpClient") as mock_client_class:
+            await service.connect()
+
+        create = mock_client_class.return_value.get_or_create_collection
+        assert create.call_count == 2
+        for call in create.call_args_list:
+            metadata = call.kwargs["metadata"]
+            assert metadata["hnsw:space"] == "cosine"
+            assert metadata["hnsw:search_ef"] >= 64
+
+    @pytest.mark.asyncio
+    async def test_collection_stats_count_runs_off_event_loop(self):
+        """Test that the blocking Chroma count call runs in a worker thread."""
+        calling_threads = []
+        service = RAGService()
+        service._client = MagicMock()
+        service._collection = MagicMock()
+        service._collection.count.side_effect = lambda: calling_threads.append(threading.get_ident()) or 7
+        service._available = True
+
+        stats = await service.get_collection_stats()
+
+        assert stats["document_count"] == 7
+        assert calling_threads and calling_threads[0] != threading.get_ident()
+
+    @pytest.mark.asyncio
+    async def test_circuit_opens_after_max_reconnect_attempts(self):
+        """Test that exhausted reconnects fail fast instead of sleeping per request."""
+        service = RAGService()
+        service._reconnect_attempts = RAGService.MAX_RECONNECT_ATTEMPTS
+
+        with patch.object(service, "connect", AsyncMock()) as mock_connect:
+            assert await service._ensure_connection() is False
+            assert service.circuit_open
+            assert await service._ensure_connection() is False
+
+        mock_connect.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_successful_health_check_closes_circuit(self):
+        """Test that a passing heartbeat closes the circuit."""
+        service = RAGService()
+        service._client = MagicMock()
+        service._reconnect_attempts = RAGService.MAX_RECONNECT_ATTEMPTS
+        service._open_circuit()
+
+        assert await service.check_connection() is True
+        assert not service.circuit_open
+        assert service._reconnect_attempts == 0
+
+
+class TestSemanticCache:
+    """Tests for the semantic answer cache."""
+
+    @pytest.fixture(autouse=True)
+    def _enable_semantic_cache(self):
+        """The semantic cache is opt-in; these tests cover it when enabled."""
+        with patch.object(get_settings(), "semantic_cache_enabled", True):
+            yield
+
+    @staticmethod
+    def _make_service(distance, age=0.0):
+        service = RAGService()
+        service._client = MagicMock()
+        service._available = True
+        service.embed_query = AsyncMock(return_value=[0.1, 0.2])
+        service._query_cache = MagicMock()
+        service._query_cache.query.return_value = {
+            "ids": [["entry-1"]],
+            "metadatas": [[{
+                "answer": "Cached answer",
+                "sources": '[{"document": "doc.txt", "chunk": "text"}]',
+                "tokens_used": 42,
+                "ts": time.time() - age,
+            }]],
+            "distances": [[distance]],
+        }
+        return service
+
+    @pytest.mark.asyncio
+    async def test_similar_question_hits(self):
+        """Test that a close paraphrase returns the stored answer."""
+        service = self._make_service(distance=0.05)
+
+        result = await service.get_semantic_answer("Расскажи про SmartTask")
+
+        assert result == {
+            "answer": "Cached answer",
+            "sources": [{"document": "doc.txt", "chunk": "text"}],
+            "tokens_used": 42,
+        }
+
+    @pytest.mark.asyncio
+    async def test_dissimilar_question_misses(self):
+        """Test that a match below the similarity threshold is ignored."""
+        service = self._make_service(distance=0.3)
+
+        assert await service.get_semantic_answer("Сколько стоит Pro?") is None
+
+    @pytest.mark.asyncio
+    async def test_expired_entry_is_pruned(self):
+        """Test that an expired entry misses and is deleted."""
+        service = self._make_service(distance=0.0, age=10 ** 6)
+
+        assert await service.get_semantic_answer("Что такое SmartTask?") is None
+        service._query_cache.delete.assert_called_once_with(ids=["entry-1"])
+
+    @pytest.mark.asyncio
+    async def test_store_upserts_entry(self):
+        """Test that generated answers are upserted with serialized sources."""
+        service = self._make_service(distance=0.0)
+
+        stored = await service.cache_semantic_answer(
+            "Что такое SmartTask?", "Answer", [{"document": "doc.txt", "chunk": "text"}], 10
+        )
+
+        assert stored is True
+        kwargs = service._query_cache.upsert.call_args.kwargs
+        assert kwargs["documents"] == ["Что такое SmartTask?"]
+        assert kwargs["embeddings"] == [[0.1, 0.2]]
+        assert kwargs["metadatas"][0]["tokens_used"] == 10
+
+    @pytest.mark.asyncio
+    async def test_store_uses_normalized_question_id(self):
+        """Test that questions differing only in case or spacing update one entry."""
+        service = self._make_service(distance=0.0)
+
+        await service.cache_semantic_answer("Что такое SmartTask?", "A", [], 1)
+        await service.cache_semantic_answer("  что такое smarttask?", "B", [], 1)
+
+        ids = [c.kwargs["ids"] for c in service._query_cache.upsert.call_args_list]
+        assert ids[0] == ids[1]
+
+    @pytest.mark.asyncio
+    async def test_distinct_russian_questions_do_not_share_answer_by_default(self):
+        """Test that the disabled default never serves one question's answer for another.
+
+        The English-only embedding can score different Russian questions
+        above the threshold (distance 0.05 here), so nothing is read or stored.
+        """
+        service = self._make_service(distance=0.05)
+
+        with patch.object(get_settings(), "semantic_cache_enabled", False):
+            stored = await service.cache_semantic_answer(
+                "Сколько стоит тариф Pro?", "$9 в месяц", [], 10
+            )
+            result = await service.get_semantic_answer("Сколько стоит тариф Enterprise?")
+
+        assert stored is False
+        assert result is None
+        service._query_cache.upsert.assert_not_called()
+        service._query_cache.query.assert_not_called()
+
+
+class TestEmbedQuery:
+    """Tests for question embedding reuse."""
+
+    @pytest.mark.asyncio
+    async def test_question_is_embedded_once(self):
+        """Test that repeat and re-cased questions reuse the first embedding."""
+        service = RAGService()
+        service._embedding_fn = MagicMock(return_value=[np.array([0.5, 0.25], dtype=np.float32)])
+
+        with patch("app.services.rag_service.cache_service") as mock_cache:
+            mock_cache.get_cached_embedding = AsyncMock(return_value=None)
+            mock_cache.set_cached_embedding = AsyncMock(return_value=True)
+
+            first = await service.embed_query("Что такое SmartTask?")
+            second = await service.embed_query("  что такое smarttask?")
+
+        assert second is first
+        service._embedding_fn.assert_called_once_with(["Что такое SmartTask?"])
+        mock_cache.set_cached_embedding.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_redis_embedding_skips_model(self):
+        """Test that an embedding stored in Redis is used without running the model."""
+        service = RAGService()
+        service._embedding_fn = MagicMock()
+        stored = np.array([0.5, 0.25], dtype=np.float32)
+
+        with patch("app.services.rag_service.cache_service") as mock_cache:
+            mock_cache.get_cached_embedding = AsyncMock(return_value=stored)
+
+            assert await service.embed_query("Вопрос") is stored
+
+        service._embedding_fn.assert_not_called()
+
 
 class TestCacheService:
     """Tests for cache service functionality."""
     
-    @pytest.mark.asyncio
-    async def test_hash_question_consistency(self):
+    def test_hash_question_consistency(self):
         """Test that same question produces same hash."""
-        from app.services.cache_service import CacheService
-        
         service = CacheService()
         
         hash1 = service._hash_question("What is SmartTask?")
@@ -122,11 +427,8 @@ class TestCacheService:
         assert hash1 == hash2
         assert hash1 == hash3  # Should be case-insensitive
     
-    @pytest.mark.asyncio
-    async def test_hash_different_questions(self):
+    def test_hash_different_questions(self):
         """Test that different questions produce different hashes."""
-        from app.services.cache_service import CacheService
-        
         service = CacheService()
         
         hash1 = service._hash_question("What is SmartTask?")
@@ -137,8 +439,6 @@ class TestCacheService:
     @pytest.mark.asyncio
     async def test_cache_miss_returns_none(self):
         """Test that cache miss returns None."""
-        from app.services.cache_service import CacheService
-        
         service = CacheService()
         
         # Mock Redis client
@@ -153,9 +453,6 @@ class TestCacheService:
     @pytest.mark.asyncio
     async def test_cache_hit_returns_data(self):
         """Test that cache hit returns cached data."""
-        import json
-        from app.services.cache_service import CacheService
-        
         service = CacheService()
         
         cached_data = {
@@ -166,7 +463,7 @@ class TestCacheService:
         
         # Mock Redis client
         mock_redis = AsyncMock()
-        mock_redis.get.return_value = json.dumps(cached_data)
+        mock_redis.get.return_value = orjson.dumps(cached_data)
         service._client = mock_redis
         
         result = await service.get_cached_answer("What is SmartTask?")